@@ -0,0 +1,114 @@
+"""Per-account async locks for balance mutations, with contention metrics"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+
+class LockStripe:
+    """The locks of the accounts hashed onto this stripe, plus its contention counters"""
+
+    def __init__(self):
+        self.locks = {}  # user_id -> [lock, holders + waiters]
+        self.acquisitions = 0
+        self.contended = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    async def acquire(self, user_id: str):
+        entry = self.locks.get(user_id)
+        if entry is None:
+            entry = self.locks[user_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        self.acquisitions += 1
+        if entry[1] == 1:
+            # Nobody else holds or wants this account, so this never blocks
+            await entry[0].acquire()
+            return
+
+        self.contended += 1
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        started = time.perf_counter()
+        try:
+            await entry[0].acquire()
+        except BaseException:
+            # Cancelled while queued
+            self._drop(user_id, entry)
+            raise
+        finally:
+            self.waiting -= 1
+            waited = time.perf_counter() - started
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+    def release(self, user_id: str):
+        entry = self.locks[user_id]
+        entry[0].release()
+        self._drop(user_id, entry)
+
+    def _drop(self, user_id: str, entry: list):
+        entry[1] -= 1
+        # Evict as soon as the account goes idle
+        if entry[1] == 0:
+            del self.locks[user_id]
+
+    def stats(self) -> dict:
+        return {
+            "locks": len(self.locks),
+            "acquisitions": self.acquisitions,
+            "contended": self.contended,
+            "waiting": self.waiting,
+            "max_waiting": self.max_waiting,
+            "avg_wait_ms": round(self.wait_seconds * 1000 / self.contended, 3) if self.contended else 0.0,
+            "max_wait_ms": round(self.max_wait_seconds * 1000, 3),
+        }
+
+
+class AccountLocks:
+    """Serializes balance mutations per account while different accounts run in parallel.
+
+    Each account gets its own asyncio.Lock only while someone holds or waits
+    for it. Accounts hash onto a fixed number of stripes that own those locks
+    and the contention counters, so memory and metrics stay bounded. Locks are
+    per process; they do not coordinate several server workers.
+    """
+
+    def __init__(self, stripes: int = 64):
+        self.stripes = [LockStripe() for _ in range(stripes)]
+
+    def _stripe(self, user_id: str) -> LockStripe:
+        return self.stripes[hash(user_id) % len(self.stripes)]
+
+    @asynccontextmanager
+    async def hold(self, *user_ids):
+        """Lock every given account; sorted order means two holders can never deadlock"""
+        acquired = []
+        try:
+            for user_id in sorted({user_id for user_id in user_ids if user_id}):
+                await self._stripe(user_id).acquire(user_id)
+                acquired.append(user_id)
+            yield
+        finally:
+            for user_id in reversed(acquired):
+                self._stripe(user_id).release(user_id)
+
+    def stats(self, hottest: int = 10) -> dict:
+        stripes = [(index, stripe.stats()) for index, stripe in enumerate(self.stripes)]
+        contended = sum(stats["contended"] for _, stats in stripes)
+        wait_ms = sum(stripe.wait_seconds for stripe in self.stripes) * 1000
+        return {
+            "stripes": len(self.stripes),
+            "active_locks": sum(stats["locks"] for _, stats in stripes),
+            "acquisitions": sum(stats["acquisitions"] for _, stats in stripes),
+            "contended": contended,
+            "waiting": sum(stats["waiting"] for _, stats in stripes),
+            "avg_wait_ms": round(wait_ms / contended, 3) if contended else 0.0,
+            "max_wait_ms": max(stats["max_wait_ms"] for _, stats in stripes),
+            "hottest_stripes": [
+                {"stripe": index, **stats}
+                for index, stats in sorted(stripes, key=lambda pair: pair[1]["contended"], reverse=True)[:hottest]
+                if stats["acquisitions"]
+            ],
+        }
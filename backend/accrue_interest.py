@@ -0,0 +1,169 @@
+"""Savings interest accrual job.
+
+Streams savings balances in id order, computes tiered interest for the whole
+chunk with NumPy, then credits it with one bulk_write of $inc updates plus one
+insert_many of matching "credit" transactions per chunk.
+
+Each account is stamped with the accrual period it was last credited for, and
+the interest transaction id is derived from (user id, period), so re-running a
+period (after a crash or by mistake) never credits an account twice. A rerun
+credits exactly the amount of any interest transaction already written for the
+period, even if the balance has moved since, so the ledger always matches.
+
+Credited accounts get transactions_changed_at, so servers drop their cached
+recent transactions for them instead of waiting out the cache TTL.
+
+    python accrue_interest.py --compounding monthly --period 2026-10
+    python accrue_interest.py --compounding daily --tiers 0:0.005,10000:0.01,100000:0.015
+"""
+import argparse
+import asyncio
+import time
+import uuid
+from datetime import datetime
+from typing import List, Tuple
+
+import numpy as np
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from mongo_errors import is_duplicate_key_error
+from server import Transaction
+from settings import Settings
+
+PERIODS_PER_YEAR = {"daily": 365, "monthly": 12}
+DEFAULT_TIERS = "0:0.005,10000:0.01,100000:0.015"
+
+
+def parse_tiers(value: str) -> List[Tuple[float, float]]:
+    """"floor:annual_rate,..." -> [(floor, annual_rate)] sorted by floor"""
+    tiers = sorted((float(floor), float(rate)) for floor, rate in (tier.split(":") for tier in value.split(",")))
+    if not tiers or tiers[0][0] != 0:
+        raise argparse.ArgumentTypeError("the first tier must start at 0")
+    return tiers
+
+
+def tiered_interest(balances: np.ndarray, tiers: List[Tuple[float, float]], periods_per_year: int) -> np.ndarray:
+    """Interest for one period, rounded to cents; each slice of a balance earns its own tier's rate"""
+    interest = np.zeros_like(balances)
+    floors = [floor for floor, _ in tiers]
+    ceilings = floors[1:] + [np.inf]
+    for (floor, annual_rate), ceiling in zip(tiers, ceilings):
+        in_tier = np.clip(balances - floor, 0, ceiling - floor)
+        interest += in_tier * (annual_rate / periods_per_year)
+    return np.round(interest, 2)
+
+
+def interest_transaction_id(user_id: str, period: str) -> str:
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"savings-interest:{user_id}:{period}"))
+
+
+async def accrue(db, period: str, tiers, periods_per_year: int, chunk_size: int) -> dict:
+    await db.users.create_index("id")
+    await db.transactions.create_index("id", unique=True, name="transaction_id_unique")
+
+    stats = {"accounts": 0, "credited": 0, "interest": 0.0}
+    last_id = ""
+    while True:
+        # Keyset over id, skipping accounts already credited for this period
+        chunk = await db.users.find(
+            {"id": {"$gt": last_id}, "savings_balance": {"$gt": 0}, "last_interest_period": {"$ne": period}},
+            {"_id": 0, "id": 1, "savings_balance": 1}
+        ).sort("id", 1).limit(chunk_size).to_list(chunk_size)
+        if not chunk:
+            return stats
+        last_id = chunk[-1]["id"]
+
+        user_ids = [user["id"] for user in chunk]
+        interest = tiered_interest(np.array([user["savings_balance"] for user in chunk], dtype=float), tiers, periods_per_year)
+
+        # An interrupted run may have written some of these transactions without
+        # the balance update; those amounts are what the ledger says was paid
+        transaction_ids = [interest_transaction_id(user_id, period) for user_id in user_ids]
+        recorded = {
+            transaction["id"]: transaction["amount"]
+            async for transaction in db.transactions.find({"id": {"$in": transaction_ids}}, {"_id": 0, "id": 1, "amount": 1})
+        }
+        for i, transaction_id in enumerate(transaction_ids):
+            if transaction_id in recorded:
+                interest[i] = recorded[transaction_id]
+        credited = np.nonzero(interest > 0)[0]
+        stats["accounts"] += len(chunk)
+
+        now = datetime.utcnow()
+        transactions = [
+            Transaction(
+                id=transaction_ids[i],
+                from_user_id="system",
+                from_account_type="savings",
+                to_user_id=user_ids[i],
+                to_account_info="savings",
+                amount=float(interest[i]),
+                transaction_type="credit",
+                description=f"Savings interest {period}",
+                status="approved",
+                created_at=now,
+                approved_at=now
+            ).dict()
+            for i in credited if transaction_ids[i] not in recorded
+        ]
+        if transactions:
+            try:
+                await db.transactions.insert_many(transactions, ordered=False)
+            except BulkWriteError as e:
+                # Duplicates are transactions a concurrent run wrote since the lookup
+                if not is_duplicate_key_error(e):
+                    raise
+                duplicate_ids = [transactions[error["index"]]["id"] for error in e.details["writeErrors"]]
+                async for transaction in db.transactions.find({"id": {"$in": duplicate_ids}}, {"_id": 0, "id": 1, "amount": 1}):
+                    interest[transaction_ids.index(transaction["id"])] = transaction["amount"]
+
+        # The period stamp in the filter makes each $inc apply at most once. The
+        # change stamp is taken after the insert: only caches filled before it can
+        # be missing the interest transaction, and those are the ones it drops
+        changed_at = datetime.utcnow()
+        updates = [
+            UpdateOne(
+                {"id": user_ids[i], "last_interest_period": {"$ne": period}},
+                {"$inc": {"savings_balance": float(interest[i])},
+                 "$set": {"last_interest_period": period, "transactions_changed_at": changed_at}}
+            )
+            for i in credited
+        ]
+        if updates:
+            result = await db.users.bulk_write(updates, ordered=False)
+            stats["credited"] += result.modified_count
+            stats["interest"] += float(interest[credited].sum())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--compounding", choices=PERIODS_PER_YEAR, default="monthly")
+    parser.add_argument("--period", help="accrual period key; defaults to today (daily) or this month (monthly)")
+    parser.add_argument("--tiers", type=parse_tiers, default=parse_tiers(DEFAULT_TIERS),
+                        help=f"floor:annual_rate pairs (default {DEFAULT_TIERS})")
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    period = args.period or datetime.utcnow().strftime("%Y-%m-%d" if args.compounding == "daily" else "%Y-%m")
+    settings = Settings.from_env()
+
+    async def run():
+        client = AsyncIOMotorClient(settings.mongo_url, **settings.mongo_client_options())
+        try:
+            started = time.perf_counter()
+            stats = await accrue(client[settings.db_name], period, args.tiers,
+                                 PERIODS_PER_YEAR[args.compounding], args.chunk_size)
+            elapsed = time.perf_counter() - started
+        finally:
+            client.close()
+        print(f"period {period}: {stats['accounts']} accounts, {stats['credited']} credited, "
+              f"{stats['interest']:.2f} interest in {elapsed:.1f}s "
+              f"({stats['accounts'] / elapsed if elapsed else 0:.0f} accounts/s)")
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+"""Cache for the bank-wide analytics report, recomputed at most once per TTL"""
+import asyncio
+import time
+
+
+class AnalyticsCache:
+    """Holds one computed value for ttl seconds; concurrent misses share a single recompute"""
+
+    def __init__(self):
+        self.value = None
+        self.expires_at = 0.0
+        self.generation = 0  # bumped by every invalidation
+        self.lock = asyncio.Lock()
+
+    def invalidate(self):
+        self.expires_at = 0.0
+        self.generation += 1
+
+    async def get_or_compute(self, compute, ttl: float):
+        if self.value is not None and time.monotonic() < self.expires_at:
+            return self.value
+        async with self.lock:
+            # Another request may have recomputed while we waited for the lock
+            if self.value is not None and time.monotonic() < self.expires_at:
+                return self.value
+            started = time.monotonic()
+            generation = self.generation
+            self.value = await compute()
+            # An invalidation during the recompute leaves the new value already stale
+            self.expires_at = started + ttl if generation == self.generation else 0.0
+            return self.value
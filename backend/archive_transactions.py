@@ -0,0 +1,87 @@
+"""Transaction archiving job.
+
+Moves settled (approved or declined) transactions older than
+ARCHIVE_AFTER_DAYS from transactions into transactions_archive, in the
+compact schema defined by server.ARCHIVE_FIELDS. Pending transactions are
+never moved, however old.
+
+Each batch is copied before it is deleted, and archived documents are keyed by
+transaction id, so an interrupted run can simply be started again. Before a
+batch is copied, its users are flagged with has_archived_transactions;
+history reads skip the archive for everyone else.
+
+Customer history reads rely on everything in the archive being older than
+that same setting, so the age is not overridable from the command line.
+
+    ARCHIVE_AFTER_DAYS=90 python archive_transactions.py
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import BulkWriteError
+
+from mongo_errors import is_duplicate_key_error
+from server import ARCHIVE_INDEXES, SETTLED_STATUSES, compact_transaction
+from settings import Settings
+
+
+async def archive(db, cutoff: datetime, batch_size: int) -> int:
+    for keys, name in ARCHIVE_INDEXES:
+        await db.transactions_archive.create_index(keys, name=name)
+
+    moved = 0
+    while True:
+        batch = await db.transactions.find(
+            {"status": {"$in": SETTLED_STATUSES}, "created_at": {"$lt": cutoff}},
+            {"_id": 0}
+        ).sort("created_at", 1).limit(batch_size).to_list(batch_size)
+        if not batch:
+            return moved
+
+        user_ids = {t["from_user_id"] for t in batch} | {t["to_user_id"] for t in batch if t.get("to_user_id")}
+        await db.users.update_many(
+            {"id": {"$in": list(user_ids)}, "has_archived_transactions": {"$ne": True}},
+            {"$set": {"has_archived_transactions": True}}
+        )
+
+        try:
+            await db.transactions_archive.insert_many([compact_transaction(t) for t in batch], ordered=False)
+        except BulkWriteError as e:
+            # Duplicates were copied by an interrupted earlier run
+            if not is_duplicate_key_error(e):
+                raise
+
+        result = await db.transactions.delete_many({
+            "id": {"$in": [t["id"] for t in batch]},
+            "status": {"$in": SETTLED_STATUSES}
+        })
+        moved += result.deleted_count
+
+
+def main():
+    settings = Settings.from_env()
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=settings.archive_batch_size)
+    args = parser.parse_args()
+
+    cutoff = datetime.utcnow() - timedelta(days=settings.archive_after_days)
+
+    async def run():
+        client = AsyncIOMotorClient(settings.mongo_url, **settings.mongo_client_options())
+        try:
+            started = time.perf_counter()
+            moved = await archive(client[settings.db_name], cutoff, args.batch_size)
+            elapsed = time.perf_counter() - started
+        finally:
+            client.close()
+        print(f"archived {moved} transactions created before {cutoff:%Y-%m-%d} in {elapsed:.1f}s")
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""Rule-based approval of low-risk pending transfers"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional
+
+from fastapi import HTTPException
+from pymongo import ReturnDocument
+
+from background import cancel_tasks
+
+logger = logging.getLogger(__name__)
+
+
+class AutoApprover:
+    """Workers that lease pending transfers and approve the ones a rule allows.
+
+    Each transfer is evaluated once (auto_reviewed); anything no rule allows,
+    or whose approval fails, is released back to the admin queue.
+    approve(transaction, completed_filter, recheck) settles a leased transfer
+    the way an admin approval does, calling recheck(sender) under the sender's
+    lock, and returns the approval time.
+    """
+
+    ACTOR_ID = "auto-approver"
+    LEASE_SECONDS = 60
+
+    def __init__(self, get_collection, approve: Callable[..., Awaitable[datetime]],
+                 available_filter: Callable[[datetime], dict], claim_sort: list,
+                 workers: int = 4, poll_interval_ms: float = 1000):
+        self.get_collection = get_collection
+        self.approve = approve
+        self.available_filter = available_filter  # pending and not leased
+        self.claim_sort = claim_sort
+        self.workers = workers
+        self.poll_interval = poll_interval_ms / 1000
+        self.rules = []
+        self.tasks = []
+        self.wakeup = None
+        self.hits = {}  # {rule name, "no_match" or "failed": count}
+        self.approved = 0
+        self.settlement_seconds = 0.0
+
+    def start(self, rules):
+        self.rules = list(rules)
+        self.hits = {rule.name: 0 for rule in self.rules}
+        self.hits.update(no_match=0, failed=0)
+        if not self.rules:
+            return
+        self.wakeup = asyncio.Event()
+        self.tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def notify(self):
+        """A transfer was just queued; look now rather than at the next poll"""
+        if self.wakeup is not None:
+            self.wakeup.set()
+
+    async def claim(self, now: datetime) -> Optional[dict]:
+        # Only rows some rule could possibly allow
+        query = self.available_filter(now)
+        query["auto_reviewed"] = {"$ne": True}
+        query["transaction_type"] = {"$in": sorted({t for rule in self.rules for t in rule.transaction_types})}
+        query["amount"] = {"$lte": max(rule.max_amount for rule in self.rules)}
+        return await self.get_collection().find_one_and_update(
+            query,
+            {"$set": {"auto_reviewed": True, "lease_owner": self.ACTOR_ID,
+                      "lease_expires_at": now + timedelta(seconds=self.LEASE_SECONDS)}},
+            sort=self.claim_sort,
+            return_document=ReturnDocument.AFTER
+        )
+
+    def candidate_rules(self, transaction: dict) -> list:
+        """Rules the transfer itself satisfies; sender conditions are checked under the sender's lock"""
+        return [
+            rule for rule in self.rules
+            if transaction["transaction_type"] in rule.transaction_types and transaction["amount"] <= rule.max_amount
+            and (rule.max_risk_score is None or transaction.get("risk_score", 0) <= rule.max_risk_score)
+        ]
+
+    async def matching_rule(self, rules: list, transaction: dict, sender: dict, now: datetime):
+        daily_total = None
+        for rule in rules:
+            if rule.min_account_age_days:
+                created_at = sender.get("created_at")
+                if created_at is None or (now - created_at).total_seconds() < rule.min_account_age_days * 86400:
+                    continue
+            if rule.max_daily_total is not None:
+                if daily_total is None:
+                    # Approved today, whenever created; an admin's approvals count too
+                    day_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+                    totals = await self.get_collection().aggregate([
+                        {"$match": {"from_user_id": transaction["from_user_id"], "status": "approved",
+                                    "approved_at": {"$gte": day_start}}},
+                        {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
+                    ]).to_list(1)
+                    daily_total = totals[0]["total"] if totals else 0.0
+                if daily_total + transaction["amount"] > rule.max_daily_total:
+                    continue
+            return rule
+        return None
+
+    async def release(self, transaction: dict):
+        await self.get_collection().update_one(
+            {"id": transaction["id"], "status": "pending", "lease_owner": self.ACTOR_ID},
+            {"$set": {"lease_owner": None, "lease_expires_at": None}}
+        )
+
+    async def review(self, transaction: dict, now: datetime):
+        rules = self.candidate_rules(transaction)
+        matched = None
+
+        async def recheck(sender: dict):
+            # Runs holding the sender's lock, so concurrent approvals can't all fit under one daily cap
+            nonlocal matched
+            matched = await self.matching_rule(rules, transaction, sender, now)
+            if matched is None:
+                raise HTTPException(status_code=409, detail="No auto-approval rule allows this transfer")
+
+        try:
+            if not rules:
+                raise HTTPException(status_code=409, detail="No auto-approval rule allows this transfer")
+            approved_at = await self.approve(
+                transaction, {"id": transaction["id"], "status": "pending", "lease_owner": self.ACTOR_ID}, recheck
+            )
+        except HTTPException as e:
+            if matched is None:
+                self.hits["no_match"] += 1
+            else:
+                # Insufficient funds and the like are left for an admin to decide
+                logger.info(f"Auto-approval of {transaction['id']} under rule {matched.name} failed: {e.detail}")
+                self.hits["failed"] += 1
+            await self.release(transaction)
+            return
+        self.hits[matched.name] += 1
+        self.approved += 1
+        self.settlement_seconds += (approved_at - transaction["created_at"]).total_seconds()
+
+    async def _worker(self):
+        while True:
+            # Cleared before claiming, so a notify during the claim is not lost
+            self.wakeup.clear()
+            try:
+                now = datetime.utcnow()
+                transaction = await self.claim(now)
+                if transaction is not None:
+                    await self.review(transaction, now)
+                    continue
+            except Exception:
+                logger.exception("Auto-approval worker failed")
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self) -> dict:
+        return {
+            "workers": len(self.tasks),
+            "rules": [rule.dict() for rule in self.rules],
+            "hits": self.hits,
+            "approved": self.approved,
+            "avg_settlement_ms": round(self.settlement_seconds * 1000 / self.approved, 1) if self.approved else None,
+        }
+
+    async def stop(self):
+        await cancel_tasks(*self.tasks)
+        self.tasks = []
@@ -0,0 +1,62 @@
+"""Customer search backfill.
+
+Stores the derived search fields (server.customer_search_document) on users
+whose search_version is missing or older than server.SEARCH_VERSION. Signup and
+the admin bootstrap store them for new users, so this only needs to run once
+after deploying a change to those fields; workers never scan users at startup.
+
+Only outdated users are read, through the search_version index, so an
+interrupted run can simply be started again.
+
+    python backfill_search_fields.py [--batch-size 1000]
+"""
+import argparse
+import asyncio
+import time
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+
+from server import SEARCH_VERSION, customer_search_document
+from settings import Settings
+
+
+async def backfill(db, batch_size: int) -> int:
+    await db.users.create_index("search_version", name="customer_search_version")
+
+    updated = 0
+    batch = []
+    async for user in db.users.find(
+        {"search_version": {"$ne": SEARCH_VERSION}}, {"id": 1, "email": 1, "full_name": 1, "phone": 1}
+    ):
+        batch.append(UpdateOne({"_id": user["_id"]}, {"$set": customer_search_document(user)}))
+        if len(batch) >= batch_size:
+            updated += (await db.users.bulk_write(batch, ordered=False)).modified_count
+            batch = []
+    if batch:
+        updated += (await db.users.bulk_write(batch, ordered=False)).modified_count
+    return updated
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    settings = Settings.from_env()
+
+    async def run():
+        client = AsyncIOMotorClient(settings.mongo_url, **settings.mongo_client_options())
+        try:
+            started = time.perf_counter()
+            updated = await backfill(client[settings.db_name], args.batch_size)
+            elapsed = time.perf_counter() - started
+        finally:
+            client.close()
+        print(f"backfilled search fields (version {SEARCH_VERSION}) for {updated} users in {elapsed:.1f}s")
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
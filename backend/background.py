@@ -0,0 +1,14 @@
+"""Shutdown helper for the long-running asyncio tasks behind the background workers"""
+import asyncio
+
+
+async def cancel_tasks(*tasks: asyncio.Task):
+    """Cancel the tasks and wait until each has finished; None entries are skipped"""
+    tasks = [task for task in tasks if task is not None]
+    for task in tasks:
+        task.cancel()
+    for task in tasks:
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
@@ -0,0 +1,128 @@
+"""Concurrent approvals with and without the per-account locks.
+
+Thousands of pending internal transfers, with senders drawn from a Zipf
+distribution so a few accounts are very hot, are approved concurrently through
+process_transaction. Every account starts with enough money for only some of
+its transfers. Without locks, approvals interleave between the balance check
+and the debit and overdraw accounts; with them, every balance must match its
+ledger and none may go negative. Mongo is simulated in memory with a fixed
+round-trip latency.
+
+    python benchmarks/bench_account_locks.py [--transfers 5000] [--accounts 1000] [--skew 1.3]
+"""
+import argparse
+import asyncio
+import sys
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import server  # noqa: E402
+from account_locks import AccountLocks  # noqa: E402
+from fastapi import HTTPException  # noqa: E402
+from settings import Settings  # noqa: E402
+from simulated import Admin, SimulatedDatabase  # noqa: E402
+
+
+class NoLocks:
+    @asynccontextmanager
+    async def hold(self, *user_ids):
+        yield
+
+
+async def run(locks, args, seed: int):
+    rng = np.random.default_rng(seed)
+    db = SimulatedDatabase(args.round_trip_ms)
+    server.db = db
+    server.account_locks = locks
+
+    accounts = [f"user-{index}" for index in range(args.accounts)]
+    for user_id in accounts:
+        db.users.documents[user_id] = {"id": user_id, "checking_balance": args.opening_balance, "savings_balance": 0.0}
+    senders = (rng.zipf(args.skew, args.transfers) - 1) % args.accounts
+    recipients = rng.integers(0, args.accounts, args.transfers)
+    transfers = []
+    for index, (sender, recipient) in enumerate(zip(senders, recipients)):
+        transfer = {
+            "id": f"t-{index}", "from_user_id": accounts[sender], "from_account_type": "checking",
+            "to_user_id": accounts[recipient], "amount": args.amount, "transaction_type": "internal",
+            "status": "pending", "lease_owner": None, "lease_expires_at": None,
+        }
+        db.transactions.documents[transfer["id"]] = transfer
+        transfers.append(transfer)
+
+    declined = 0
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def approve(transfer):
+        nonlocal declined
+        async with semaphore:
+            try:
+                await server.process_transaction(transfer["id"], "approve", Admin)
+            except HTTPException:
+                declined += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(approve(transfer) for transfer in transfers))
+    elapsed = time.perf_counter() - started
+
+    # Every balance must equal opening balance plus its approved ledger entries
+    expected = {user_id: args.opening_balance for user_id in accounts}
+    for transfer in transfers:
+        if db.transactions.documents[transfer["id"]]["status"] == "approved":
+            expected[transfer["from_user_id"]] -= transfer["amount"]
+            expected[transfer["to_user_id"]] += transfer["amount"]
+    balances = {user_id: db.users.documents[user_id]["checking_balance"] for user_id in accounts}
+    overdrawn = sum(1 for balance in balances.values() if balance < -1e-9)
+    off_ledger = sum(1 for user_id in accounts if abs(balances[user_id] - expected[user_id]) > 1e-6)
+    return {
+        "approved": args.transfers - declined,
+        "declined": declined,
+        "overdrawn": overdrawn,
+        "off_ledger": off_ledger,
+        "approvals_per_s": (args.transfers - declined) / elapsed,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--transfers", type=int, default=5000)
+    parser.add_argument("--accounts", type=int, default=1000)
+    parser.add_argument("--skew", type=float, default=1.3, help="Zipf exponent for sender selection")
+    parser.add_argument("--concurrency", type=int, default=1000)
+    parser.add_argument("--opening-balance", type=float, default=50.0)
+    parser.add_argument("--amount", type=float, default=10.0)
+    parser.add_argument("--round-trip-ms", type=float, default=1)
+    args = parser.parse_args()
+
+    server.settings = Settings(mongo_url="mongodb://unused", db_name="bench")
+    server.logger.disabled = True
+
+    locks = AccountLocks()
+    results = {"no locks": await run(NoLocks(), args, seed=1), "AccountLocks": await run(locks, args, seed=1)}
+
+    print(f"transfers={args.transfers} accounts={args.accounts} skew={args.skew} "
+          f"concurrency={args.concurrency} round_trip_ms={args.round_trip_ms}")
+    print(f"{'variant':<14}{'approved':>10}{'declined':>10}{'overdrawn':>11}{'off ledger':>12}{'approvals/s':>13}")
+    for name, result in results.items():
+        print(f"{name:<14}{result['approved']:>10}{result['declined']:>10}{result['overdrawn']:>11}"
+              f"{result['off_ledger']:>12}{result['approvals_per_s']:>13.0f}")
+
+    stats = locks.stats(hottest=3)
+    print(f"\ncontended {stats['contended']} of {stats['acquisitions']} acquisitions, "
+          f"avg wait {stats['avg_wait_ms']} ms, max wait {stats['max_wait_ms']} ms, "
+          f"{stats['active_locks']} locks left after the run")
+    for stripe in stats["hottest_stripes"]:
+        print(f"  stripe {stripe['stripe']}: {stripe['contended']} contended, max queue {stripe['max_waiting']}, "
+              f"avg wait {stripe['avg_wait_ms']} ms")
+
+    if results["AccountLocks"]["overdrawn"] or results["AccountLocks"]["off_ledger"]:
+        sys.exit("balance invariants violated with AccountLocks")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,75 @@
+"""Admin request latency with no audit, a synchronous audit insert, and the queued AuditLog.
+
+Each simulated admin request does one Mongo round trip of its own; the
+synchronous variant adds a second for the audit insert, the queued variant
+only enqueues. Mongo is simulated with a fixed round-trip latency.
+
+    python benchmarks/bench_audit_overhead.py [--requests 5000] [--round-trip-ms 2]
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import server  # noqa: E402
+from server import AuditLog  # noqa: E402
+from simulated import Admin, SimulatedCollection  # noqa: E402
+
+
+async def measure(handler, requests: int, concurrency: int):
+    latencies = []
+    queue = iter(range(requests))
+
+    async def worker():
+        for index in queue:
+            start = time.perf_counter()
+            await handler(index)
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    latencies.sort()
+    return statistics.median(latencies) * 1000, latencies[int(len(latencies) * 0.99)] * 1000
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--round-trip-ms", type=float, default=2)
+    args = parser.parse_args()
+
+    users = SimulatedCollection(args.round_trip_ms)
+    audit_collection = SimulatedCollection(args.round_trip_ms)
+    audit_log = AuditLog(lambda: audit_collection)
+    server.logger.disabled = True
+
+    async def no_audit(index):
+        await users.update_one({"id": index}, {"$set": {"is_approved": True}})
+
+    async def sync_audit(index):
+        await no_audit(index)
+        await audit_collection.insert_one({"admin_id": Admin.id, "action": "approve_user", "target_user_id": index})
+
+    async def queued_audit(index):
+        await no_audit(index)
+        await audit_log.record(Admin, "approve_user", target_user_id=index)
+
+    results = {"no audit": await measure(no_audit, args.requests, args.concurrency),
+               "sync insert_one": await measure(sync_audit, args.requests, args.concurrency)}
+    audit_log.start()
+    results["queued AuditLog"] = await measure(queued_audit, args.requests, args.concurrency)
+    await audit_log.stop()
+
+    print(f"requests={args.requests} concurrency={args.concurrency} round_trip_ms={args.round_trip_ms}")
+    print(f"{'variant':<18}{'p50 ms':>10}{'p99 ms':>10}")
+    for name, (p50, p99) in results.items():
+        print(f"{name:<18}{p50:>10.2f}{p99:>10.2f}")
+    print(f"audit events written: {audit_collection.inserted - args.requests} queued, dropped {audit_log.dropped}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
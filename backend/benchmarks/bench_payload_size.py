@@ -0,0 +1,91 @@
+"""Response payload size for the default field selection vs. every stored field.
+
+Builds representative user and transaction documents, applies each endpoint's
+projection the way MongoDB would, and compares serialized JSON sizes.
+
+    python benchmarks/bench_payload_size.py [--users 1000] [--transactions 100]
+"""
+import argparse
+import json
+import sys
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+
+from server import FIELD_SETS, Transaction, User, field_projection  # noqa: E402
+
+# Same length as a bcrypt hash; hashing for real would only slow the benchmark down
+HASHED_PASSWORD = "$2b$12$" + "x" * 53
+
+
+def make_user(index: int) -> dict:
+    user = User(
+        email=f"customer{index}@example.com",
+        full_name=f"Customer Number {index}",
+        ssn="123-45-6789",
+        tin="12-3456789",
+        phone="555-123-4567",
+        address=f"{index} Long Street Name, Apartment 12B, Springfield, IL 62704",
+        is_approved=True,
+        checking_balance=1523.17,
+        savings_balance=20450.00,
+    ).dict()
+    user["hashed_password"] = HASHED_PASSWORD
+    user["force_logout_at"] = datetime.utcnow()
+    return user
+
+
+def make_transaction(user_id: str) -> dict:
+    return Transaction(
+        from_user_id=user_id,
+        to_account_info="IBAN GB29 NWBK 6016 1331 9268 19, SWIFT NWBKGB2L",
+        amount=250.0,
+        transaction_type="international",
+        description="Invoice 2024-118 consulting services",
+        admin_notes="Verified by phone",
+    ).dict()
+
+
+def project(document: dict, projection: dict) -> dict:
+    return {field: value for field, value in document.items() if projection.get(field) == 1}
+
+
+def size(payload) -> int:
+    return len(json.dumps(jsonable_encoder(payload)).encode())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--transactions", type=int, default=100)
+    args = parser.parse_args()
+
+    users = [make_user(index) for index in range(args.users)]
+    transactions = [make_transaction(str(uuid.uuid4())) for _ in range(args.transactions)]
+    samples = {
+        "dashboard.user": [users[0]],
+        "dashboard.transactions": transactions[:10],
+        "transactions": transactions,
+        "admin.pending-users": users[:100],
+        "admin.pending-transactions": transactions,
+        "admin.users": users,
+    }
+
+    print(f"{'endpoint':<28}{'all fields':>14}{'default':>14}{'saved':>8}")
+    for endpoint in FIELD_SETS:
+        projection = field_projection(endpoint, None)
+        full = size(samples[endpoint])
+        slim = size([project(document, projection) for document in samples[endpoint]])
+        print(f"{endpoint:<28}{full:>12} B{slim:>12} B{1 - slim / full:>8.0%}")
+
+    balances_only = field_projection("dashboard.user", "checking_balance,savings_balance")
+    print(f"{'dashboard.user?fields=balances':<28}{size(users[0]):>12} B"
+          f"{size(project(users[0], balances_only)):>12} B")
+
+
+if __name__ == "__main__":
+    main()
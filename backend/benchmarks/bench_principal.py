@@ -0,0 +1,68 @@
+"""Per-request cost of building the authenticated caller: full User model vs. slotted Principal.
+
+Measures CPU time and allocated bytes per construction, as paid by every
+authenticated poll of /dashboard or /check-force-logout.
+
+    python benchmarks/bench_principal.py [--iterations 100000]
+"""
+import argparse
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from server import Principal, User  # noqa: E402
+
+FULL_DOCUMENT = {
+    "id": "0b5f8a52-5d7e-4a52-9d0e-6f7c2f1a9b11",
+    "email": "customer@example.com",
+    "full_name": "Customer Number One",
+    "ssn": "123-45-6789",
+    "tin": "12-3456789",
+    "phone": "555-123-4567",
+    "address": "1 Long Street Name, Apartment 12B, Springfield, IL 62704",
+    "role": "customer",
+    "is_approved": True,
+    "created_at": datetime.utcnow(),
+    "checking_balance": 1523.17,
+    "savings_balance": 20450.0,
+    "account_frozen": False,
+    "hashed_password": "$2b$12$" + "x" * 53,
+    "search_keys": ["customer", "number", "one"],
+}
+AUTH_DOCUMENT = {field: FULL_DOCUMENT[field] for field in Principal.AUTH_PROJECTION if field in FULL_DOCUMENT}
+
+
+def per_call(build, document, iterations: int):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        build(document)
+    cpu_us = (time.perf_counter() - start) / iterations * 1e6
+
+    tracemalloc.start()
+    sample = [build(document) for _ in range(1000)]
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del sample
+    return cpu_us, allocated / 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=100000)
+    args = parser.parse_args()
+
+    results = {
+        "User(**full document)": per_call(lambda document: User(**document), FULL_DOCUMENT, args.iterations),
+        "Principal(auth fields)": per_call(Principal, AUTH_DOCUMENT, args.iterations),
+    }
+    print(f"{'construction':<26}{'us/request':>12}{'bytes/request':>16}")
+    for name, (cpu_us, allocated) in results.items():
+        print(f"{name:<26}{cpu_us:>12.2f}{allocated:>16.0f}")
+
+
+if __name__ == "__main__":
+    main()
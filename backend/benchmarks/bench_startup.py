@@ -0,0 +1,74 @@
+"""Worker cold-start time, measured from `import server` to the first served request.
+
+Each run is a fresh interpreter so module import cost is included. Needs the
+MongoDB configured in backend/.env, since startup creates indexes.
+
+    python benchmarks/bench_startup.py [--runs 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+CONFIGURATIONS = {
+    "default": {},
+    "no-admin-bootstrap": {"BOOTSTRAP_ADMIN": "false"},
+    "warm-10": {"BOOTSTRAP_ADMIN": "false", "MONGO_WARM_CONNECTIONS": "10"},
+}
+
+
+def child():
+    start = time.perf_counter()
+    import server
+    from fastapi.testclient import TestClient
+    imported = time.perf_counter()
+
+    with TestClient(server.create_app()) as test_client:
+        started = time.perf_counter()
+        response = test_client.get("/api/")
+        response.raise_for_status()
+        served = time.perf_counter()
+
+    print(json.dumps({
+        "import": imported - start,
+        "startup": started - imported,
+        "first_request": served - started,
+        "total": served - start,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return child()
+
+    print(f"{'configuration':<20}{'import':>10}{'startup':>10}{'request':>10}{'total':>10}   (median ms)")
+    for name, env in CONFIGURATIONS.items():
+        runs = []
+        for _ in range(args.runs):
+            output = subprocess.run(
+                [sys.executable, __file__, "--child"],
+                cwd=BACKEND_DIR,
+                env={**os.environ, **env},
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout
+            runs.append(json.loads(output.strip().splitlines()[-1]))
+        medians = [statistics.median(run[key] for run in runs) * 1000
+                   for key in ("import", "startup", "first_request", "total")]
+        print(f"{name:<20}" + "".join(f"{value:>10.1f}" for value in medians))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Transfer insert throughput with and without micro-batching.
+
+By default the Mongo round trip is simulated (fixed latency per call over a
+bounded connection pool). Pass --mongo to write to a scratch collection in the
+database configured in backend/.env instead.
+
+    python benchmarks/bench_transfer_batching.py [--transfers 5000] [--mongo]
+"""
+import argparse
+import asyncio
+import sys
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import server  # noqa: E402
+from server import InsertBatcher, Transaction  # noqa: E402
+from simulated import SimulatedCollection  # noqa: E402
+
+
+def make_transaction():
+    return Transaction(
+        from_user_id=str(uuid.uuid4()),
+        amount=20.0,
+        transaction_type="domestic",
+        description="Bill pay",
+        to_account_info="ACME Utilities",
+    ).dict()
+
+
+async def run(insert, transfers: int, concurrency: int) -> float:
+    queue = iter(range(transfers))
+
+    async def worker():
+        for _ in queue:
+            await insert(make_transaction())
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return transfers / (time.perf_counter() - start)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--transfers", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=500)
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--window-ms", type=float, default=5)
+    parser.add_argument("--round-trip-ms", type=float, default=5)
+    parser.add_argument("--pool-size", type=int, default=20)
+    parser.add_argument("--mongo", action="store_true")
+    args = parser.parse_args()
+
+    if args.mongo:
+        collection = server.db.bench_transactions
+        await collection.drop()
+    else:
+        # Larger batches cost a little more on the wire
+        collection = SimulatedCollection(args.round_trip_ms, pool_size=args.pool_size, per_document_ms=0.02)
+
+    unbatched = await run(collection.insert_one, args.transfers, args.concurrency)
+    batcher = InsertBatcher(lambda: collection, max_batch=args.batch_size, window_ms=args.window_ms)
+    batched = await run(batcher.insert, args.transfers, args.concurrency)
+
+    if args.mongo:
+        await collection.drop()
+
+    print(f"transfers={args.transfers} concurrency={args.concurrency} "
+          f"batch_size={args.batch_size} window_ms={args.window_ms}")
+    print(f"insert_one:   {unbatched:10.0f} transfers/s")
+    print(f"insert_many:  {batched:10.0f} transfers/s  ({batched / unbatched:.1f}x)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,99 @@
+"""In-memory stand-ins for Motor collections and the admin caller, shared by the benchmarks.
+
+Every call costs one simulated Mongo round trip. Documents are keyed by "id"
+(or "_id"); queries are equality filters and updates support $set and $inc,
+which is all the code paths under benchmark use.
+"""
+import asyncio
+from typing import Optional
+
+
+class Result:
+    def __init__(self, modified_count):
+        self.modified_count = modified_count
+
+
+class SimulatedCollection:
+    """A collection whose calls each take round_trip_ms, optionally over a bounded connection pool"""
+
+    def __init__(self, round_trip_ms: float, pool_size: Optional[int] = None, per_document_ms: float = 0):
+        self.round_trip = round_trip_ms / 1000
+        self.per_document = per_document_ms / 1000  # extra wire cost per document in insert_many
+        self.pool = asyncio.Semaphore(pool_size) if pool_size else None
+        self.documents = {}
+        self.inserted = 0
+
+    async def _round_trip(self, documents: int = 0):
+        if self.pool is None:
+            await asyncio.sleep(self.round_trip + documents * self.per_document)
+            return
+        async with self.pool:
+            await asyncio.sleep(self.round_trip + documents * self.per_document)
+
+    @staticmethod
+    def _key(document):
+        return document.get("id", document.get("_id"))
+
+    def _find(self, query):
+        document = self.documents.get(self._key(query))
+        if document is not None and all(document.get(field) == value for field, value in query.items()):
+            return document
+        return None
+
+    def _apply(self, document, update):
+        document.update(update.get("$set", {}))
+        for field, amount in update.get("$inc", {}).items():
+            document[field] = document.get(field, 0) + amount
+
+    def _store(self, document):
+        self.inserted += 1
+        if self._key(document) is not None:
+            self.documents[self._key(document)] = document
+
+    async def find_one(self, query, projection=None):
+        await self._round_trip()
+        document = self._find(query)
+        return dict(document) if document is not None else None
+
+    async def update_one(self, query, update):
+        await self._round_trip()
+        document = self._find(query)
+        if document is None:
+            return Result(0)
+        self._apply(document, update)
+        return Result(1)
+
+    async def find_one_and_update(self, query, update, upsert=False, return_document=None):
+        await self._round_trip()
+        document = self._find(query)
+        if document is None and upsert:
+            document = self.documents.setdefault(self._key(query), dict(query))
+        self._apply(document, update)
+        return dict(document)
+
+    async def insert_one(self, document):
+        await self._round_trip()
+        self._store(document)
+
+    async def insert_many(self, documents, ordered=True):
+        await self._round_trip(len(documents))
+        for document in documents:
+            self._store(document)
+
+
+class SimulatedDatabase:
+    """Creates each collection on first access, all with the same round trip"""
+
+    def __init__(self, round_trip_ms: float):
+        self.round_trip_ms = round_trip_ms
+        self.collections = {}
+
+    def __getattr__(self, name):
+        if name not in self.collections:
+            self.collections[name] = SimulatedCollection(self.round_trip_ms)
+        return self.collections[name]
+
+
+class Admin:
+    id = "admin"
+    email = "admin@bank.com"
@@ -0,0 +1,89 @@
+"""Password hash cost calibration.
+
+Benchmarks password verification on this machine and picks the strongest
+bcrypt cost, or argon2 time cost at a fixed memory cost, whose median verify
+time stays within the target. Prints the settings to deploy and the login
+rate the box can then sustain, so login CPU is a planned number.
+
+Hashes made at an older cost are upgraded on each user's next login.
+
+    python calibrate_password_hash.py --target-ms 250
+    python calibrate_password_hash.py --scheme argon2 --memory-kib 65536 --target-ms 250
+"""
+import argparse
+import os
+import statistics
+import time
+
+from passlib.hash import argon2, bcrypt
+
+SAMPLE_PASSWORD = "correct horse battery staple"
+
+
+def median_verify_ms(handler, samples: int) -> float:
+    hashed = handler.hash(SAMPLE_PASSWORD)
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        handler.verify(SAMPLE_PASSWORD, hashed)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def calibrate(make_handler, costs, target_ms: float, samples: int):
+    """Walk costs upward and keep the last one within target; each step costs more than the last"""
+    chosen = None
+    for cost in costs:
+        elapsed = median_verify_ms(make_handler(cost), samples)
+        print(f"  cost {cost}: {elapsed:.1f} ms")
+        if elapsed > target_ms:
+            break
+        chosen = (cost, elapsed)
+    return chosen
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scheme", choices=["bcrypt", "argon2"], default="bcrypt")
+    parser.add_argument("--target-ms", type=float, default=250, help="highest acceptable median verify time")
+    parser.add_argument("--samples", type=int, default=5)
+    parser.add_argument("--memory-kib", type=int, default=65536, help="argon2 memory cost")
+    parser.add_argument("--parallelism", type=int, default=1, help="argon2 lanes")
+    args = parser.parse_args()
+
+    if args.scheme == "bcrypt":
+        print("bcrypt rounds:")
+        chosen = calibrate(lambda rounds: bcrypt.using(rounds=rounds), range(8, 20), args.target_ms, args.samples)
+        settings = {"PASSWORD_SCHEME": "bcrypt", "BCRYPT_ROUNDS": chosen and chosen[0]}
+    else:
+        if not argon2.has_backend():
+            parser.error("argon2 needs argon2-cffi installed")
+        print(f"argon2 time cost at {args.memory_kib} KiB, parallelism {args.parallelism}:")
+        chosen = calibrate(
+            lambda time_cost: argon2.using(
+                time_cost=time_cost, memory_cost=args.memory_kib, parallelism=args.parallelism
+            ),
+            range(1, 20), args.target_ms, args.samples
+        )
+        settings = {
+            "PASSWORD_SCHEME": "argon2",
+            "ARGON2_TIME_COST": chosen and chosen[0],
+            "ARGON2_MEMORY_COST_KIB": args.memory_kib,
+            "ARGON2_PARALLELISM": args.parallelism,
+        }
+
+    if chosen is None:
+        parser.error(f"even the lowest cost takes longer than {args.target_ms} ms on this machine")
+
+    # Each verify occupies one core for its duration
+    cores = os.cpu_count() or 1
+    per_core = 1000 / chosen[1]
+    print()
+    for name, value in settings.items():
+        print(f"{name}={value}")
+    print(f"\n# {chosen[1]:.1f} ms per verify: ~{per_core:.1f} logins/s per core, "
+          f"~{per_core * cores:.0f} logins/s on this machine ({cores} cores)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Per-user live events: in-process fan-out, optionally fed from a MongoDB change stream"""
+import asyncio
+import logging
+from typing import Callable
+
+from background import cancel_tasks
+
+logger = logging.getLogger(__name__)
+
+
+class EventHub:
+    """Delivers each user's events to every stream that user has open in this process"""
+
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self.subscribers = {}  # user_id -> set of queues
+        self.published = 0
+        self.resyncs = 0
+
+    def subscribe(self, user_id: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers.setdefault(user_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: str, queue: asyncio.Queue):
+        queues = self.subscribers.get(user_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self.subscribers[user_id]
+
+    def publish(self, user_id: str, event: dict):
+        for queue in self.subscribers.get(user_id, ()):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # The client stopped reading; replace the backlog with one reload request
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait({"type": "resync"})
+                self.resyncs += 1
+            self.published += 1
+
+
+class ChangeStreamSource:
+    """Watches transaction inserts and status changes, so writes from every server worker reach every stream"""
+
+    PIPELINE = [{"$match": {"$or": [
+        {"operationType": "insert"},
+        {"operationType": "update", "updateDescription.updatedFields.status": {"$exists": True}},
+    ]}}]
+
+    def __init__(self, get_collection, on_change: Callable[[dict], None]):
+        self.get_collection = get_collection
+        self.on_change = on_change
+        self.resume_token = None
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                async with self.get_collection().watch(
+                    self.PIPELINE, full_document="updateLookup", resume_after=self.resume_token
+                ) as stream:
+                    async for change in stream:
+                        self.resume_token = change["_id"]
+                        # Gone already (archived) by the time the update was looked up
+                        if change.get("fullDocument") is not None:
+                            self.on_change(change["fullDocument"])
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Transaction change stream failed, resuming")
+                await asyncio.sleep(1)
+
+    async def stop(self):
+        await cancel_tasks(self.task)
+        self.task = None
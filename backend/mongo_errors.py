@@ -0,0 +1,18 @@
+"""Classifying write errors that retried or repeated writes are expected to hit"""
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+DUPLICATE_KEY = 11000
+
+
+def is_duplicate_key_error(error: Exception) -> bool:
+    """True if every failed write was a duplicate key, i.e. the documents were already stored.
+
+    Writes keyed by deterministic ids use this to treat a repeat of an earlier,
+    interrupted attempt as success while still raising anything else.
+    """
+    if isinstance(error, DuplicateKeyError):
+        return True
+    if isinstance(error, BulkWriteError):
+        write_errors = error.details.get("writeErrors", [])
+        return bool(write_errors) and all(write_error.get("code") == DUPLICATE_KEY for write_error in write_errors)
+    return False
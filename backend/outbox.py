@@ -0,0 +1,161 @@
+"""Transactional outbox: events written alongside approvals and relayed downstream in order"""
+import abc
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+
+async def append_event(db, event_id: str, event_type: str, payload: dict) -> Optional[int]:
+    """Store an event under the next sequence number; None if event_id was already stored"""
+    counter = await db.counters.find_one_and_update(
+        {"_id": "outbox"}, {"$inc": {"seq": 1}}, upsert=True, return_document=ReturnDocument.AFTER
+    )
+    try:
+        await db.outbox.insert_one({
+            "id": event_id,
+            "seq": counter["seq"],
+            "type": event_type,
+            "created_at": datetime.utcnow(),
+            "payload": payload
+        })
+    except DuplicateKeyError:
+        # A retried write; its sequence number stays unused and the relay skips it
+        return None
+    return counter["seq"]
+
+
+class OutboxSink(abc.ABC):
+    """Where the relay delivers events; the name keys its checkpoint"""
+
+    name = "sink"
+
+    @abc.abstractmethod
+    async def deliver(self, events: List[dict]):
+        """Deliver the batch durably, or raise so the relay retries it"""
+
+
+class NDJSONFileSink(OutboxSink):
+    """Appends one JSON event per line and fsyncs before the batch counts as delivered"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.name = f"ndjson:{path}"
+
+    async def deliver(self, events: List[dict]):
+        lines = "".join(json.dumps(event, default=str) + "\n" for event in events)
+        await run_in_threadpool(self._append, lines)
+
+    def _append(self, lines: str):
+        with open(self.path, "a") as f:
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+
+
+class OutboxRelay:
+    """Streams outbox events to a sink in sequence order, at least once.
+
+    The checkpoint (last delivered seq) is saved after each delivered batch, so a
+    crash in between redelivers that batch; consumers dedupe on event id.
+    Sequence numbers are taken before the insert, so a concurrent writer can
+    leave a short-lived hole. The relay waits for it to fill and only skips
+    it after gap_timeout, when its writer has evidently failed.
+
+    sweep, if given, is awaited before each poll to append events whose
+    writers failed before appending them.
+    """
+
+    def __init__(self, get_db, batch_size: int = 500, poll_interval_ms: float = 1000,
+                 gap_timeout_seconds: float = 30, sweep: Optional[Callable[[], Awaitable]] = None):
+        self.get_db = get_db
+        self.sweep = sweep
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval_ms / 1000
+        self.gap_timeout = gap_timeout_seconds
+        self.sink = None
+        self.task = None
+        self.wakeup = None
+        self.stopping = False
+        self.checkpoint = 0
+        self.delivered = 0
+        self.skipped = 0
+
+    def start(self, sink: OutboxSink):
+        self.sink = sink
+        self.wakeup = asyncio.Event()
+        self.stopping = False
+        self.task = asyncio.create_task(self._run())
+
+    def notify(self):
+        """Deliver new events now rather than at the next poll"""
+        if self.wakeup is not None:
+            self.wakeup.set()
+
+    async def _run(self):
+        db = self.get_db()
+        saved = await db.outbox_checkpoints.find_one({"_id": self.sink.name})
+        self.checkpoint = saved["seq"] if saved else 0
+        gap_since = None
+        while not self.stopping:
+            more = False
+            try:
+                if self.sweep is not None:
+                    await self.sweep()
+                events = await db.outbox.find(
+                    {"seq": {"$gt": self.checkpoint}}, {"_id": 0}
+                ).sort("seq", 1).limit(self.batch_size).to_list(self.batch_size)
+
+                if events and events[0]["seq"] != self.checkpoint + 1:
+                    gap_since = gap_since or time.monotonic()
+                    if time.monotonic() - gap_since < self.gap_timeout:
+                        events = []
+                    else:
+                        logger.warning(f"Outbox skipping unused seq {self.checkpoint + 1}..{events[0]['seq'] - 1}")
+                        self.skipped += events[0]["seq"] - self.checkpoint - 1
+
+                # Only deliver up to the next hole
+                ready = events[:1]
+                for event in events[1:]:
+                    if event["seq"] != ready[-1]["seq"] + 1:
+                        break
+                    ready.append(event)
+
+                if ready:
+                    gap_since = None
+                    await self.sink.deliver(ready)
+                    self.checkpoint = ready[-1]["seq"]
+                    await db.outbox_checkpoints.update_one(
+                        {"_id": self.sink.name},
+                        {"$set": {"seq": self.checkpoint, "updated_at": datetime.utcnow()}},
+                        upsert=True
+                    )
+                    self.delivered += len(ready)
+                    more = len(ready) == self.batch_size
+            except Exception:
+                logger.exception("Outbox relay failed, retrying")
+
+            if not more:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self.wakeup.clear()
+
+    async def stop(self):
+        """Finish the batch in flight; undelivered events go out after the next start"""
+        if self.task is None:
+            return
+        self.stopping = True
+        self.wakeup.set()
+        await self.task
+        self.task = None
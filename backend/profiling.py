@@ -0,0 +1,128 @@
+"""Per-request stage timings and on-demand request profiling"""
+import cProfile
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Optional
+
+# Timings for the request being handled, set by the timing middleware
+current_timings: ContextVar[Optional["RequestTimings"]] = ContextVar("current_timings", default=None)
+
+
+class RequestTimings:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}  # {stage: milliseconds}, in the order stages first ran
+
+    def add(self, name: str, milliseconds: float):
+        self.stages[name] = self.stages.get(name, 0.0) + milliseconds
+
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def server_timing_header(self) -> str:
+        entries = [f"{name};dur={duration:.2f}" for name, duration in self.stages.items()]
+        entries.append(f"total;dur={self.total_ms():.2f}")
+        return ", ".join(entries)
+
+
+@contextmanager
+def stage(name: str):
+    """Time a block as a named stage of the current request; a no-op outside requests"""
+    timings = current_timings.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, (time.perf_counter() - started) * 1000)
+
+
+class StackSampler:
+    """Samples one thread's Python stack on an interval and counts collapsed stacks.
+
+    The output is the folded format read by flamegraph.pl and speedscope. The event
+    loop thread runs every in-flight request, so concurrent requests show up too.
+    """
+
+    def __init__(self, thread_id: int, interval: float = 0.001):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self.stopped.is_set():
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.counts[";".join(reversed(stack))] += 1
+            time.sleep(self.interval)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def write(self, path: Path):
+        path.write_text("".join(f"{stack} {count}\n" for stack, count in self.counts.most_common()))
+
+
+class RequestProfiler:
+    """Profiles one request with cProfile (.prof) or the stack sampler (.collapsed).
+
+    Concurrent requests share the event loop thread, and a thread holds one
+    cProfile at a time, so only one cProfile request may run at once; check
+    available() before entering. Stack samplers can overlap freely.
+    """
+
+    MODES = ("cprofile", "sample")
+    cprofile_active = False
+
+    @classmethod
+    def available(cls, mode: str) -> bool:
+        return mode != "cprofile" or not cls.cprofile_active
+
+    def __init__(self, mode: str, output_dir: str, label: str):
+        self.mode = mode
+        self.output_dir = Path(output_dir)
+        self.label = label
+        self.profiler = None
+
+    def __enter__(self):
+        if self.mode == "cprofile":
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+            RequestProfiler.cprofile_active = True
+        else:
+            self.profiler = StackSampler(threading.get_ident())
+            self.profiler.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}-{self.label}"
+        if self.mode == "cprofile":
+            self.profiler.disable()
+            RequestProfiler.cprofile_active = False
+            self.path = self.output_dir / f"{name}.prof"
+            self.profiler.dump_stats(self.path)
+        else:
+            self.profiler.stop()
+            self.path = self.output_dir / f"{name}.collapsed"
+            self.profiler.write(self.path)
+        return False
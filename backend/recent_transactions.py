@@ -0,0 +1,77 @@
+"""Dashboard recent activity: per-user buffers of each user's newest transactions"""
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import List, Optional
+
+from timestamps import as_stored_datetime
+
+RECENT_TRANSACTIONS_SIZE = 10
+
+
+class RecentTransactionsCache:
+    """LRU of per-user newest-first transaction buffers, bounded in users and in buffer length"""
+
+    def __init__(self, max_users: int = 10000, size: int = RECENT_TRANSACTIONS_SIZE, ttl_seconds: float = 300):
+        self.max_users = max_users
+        self.size = size
+        self.ttl = ttl_seconds
+        self.entries = OrderedDict()  # user_id -> (expires_at, [transaction, newest first], filled_at)
+        self.filling = {}  # user_id -> transactions written while its cold-start fill was reading
+        self.hits = 0
+        self.misses = 0
+
+    def merge(self, buffer: List[dict], transaction: dict) -> List[dict]:
+        """The buffer with this transaction added or replaced, still newest first and bounded"""
+        transaction = {field: value for field, value in transaction.items() if field != "_id"}
+        # Buffers hold timestamps as read back from Mongo, so ordering and values match the source
+        for field in ("created_at", "approved_at"):
+            transaction[field] = as_stored_datetime(transaction.get(field))
+        others = [existing for existing in buffer if existing["id"] != transaction["id"]]
+        # A full buffer of other rows means anything older than its last row is out of the window
+        if len(others) == len(buffer) and len(buffer) >= self.size and transaction["created_at"] < buffer[-1]["created_at"]:
+            return buffer
+        merged = sorted(others + [transaction], key=lambda existing: existing["created_at"], reverse=True)
+        return merged[:self.size]
+
+    async def get(self, user_id: str, load, changed_at: Optional[datetime] = None) -> List[dict]:
+        """The user's buffer, refilled if expired or older than changed_at (a write this process never saw)"""
+        entry = self.entries.get(user_id)
+        if entry is not None and entry[0] > time.monotonic() and (changed_at is None or changed_at < entry[2]):
+            self.entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        if user_id in self.filling:
+            # Another request is already filling this user
+            return await load()
+
+        # Cold start: read the source, then replay any writes that raced with the read.
+        # Stamps are stored to the millisecond, so one in this same millisecond counts as newer.
+        filled_at = as_stored_datetime(datetime.utcnow())
+        self.filling[user_id] = []
+        try:
+            buffer = await load()
+        finally:
+            raced = self.filling.pop(user_id)
+        for transaction in raced:
+            buffer = self.merge(buffer, transaction)
+        self.entries[user_id] = (time.monotonic() + self.ttl, buffer, filled_at)
+        self.entries.move_to_end(user_id)
+        while len(self.entries) > self.max_users:
+            self.entries.popitem(last=False)
+        return buffer
+
+    def apply(self, transaction: dict):
+        """Write-through for a committed insert or status change"""
+        for user_id in {transaction["from_user_id"], transaction.get("to_user_id")} - {None, "system"}:
+            if user_id in self.filling:
+                self.filling[user_id].append(transaction)
+            entry = self.entries.get(user_id)
+            if entry is not None:
+                self.entries[user_id] = (entry[0], self.merge(entry[1], transaction), entry[2])
+
+    def forget(self, transaction: dict):
+        """Drop both parties' buffers after a write that could not be applied"""
+        for user_id in (transaction.get("from_user_id"), transaction.get("to_user_id")):
+            self.entries.pop(user_id, None)
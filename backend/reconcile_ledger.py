@@ -0,0 +1,198 @@
+"""Ledger reconciliation job.
+
+Recomputes every account's expected checking and savings balance from the
+approved transactions, hot and archived, and compares it with the balance
+stored on the user.
+
+The user-id space (uuid4 hex) is split into contiguous ranges that a bounded
+pool of workers reconciles concurrently. Each range runs two grouped
+aggregations over the transactions (debits by sender, credits by recipient),
+both served by partial indexes on approved transactions. Mismatches are
+written to an NDJSON report as soon as their range finishes.
+
+Balances keep moving while the job runs, so a mismatch is re-checked once
+for that single account before it is reported.
+
+    python reconcile_ledger.py --workers 8 --partitions 64 --report mismatches.ndjson
+"""
+import argparse
+import asyncio
+import json
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from server import ARCHIVE_FIELDS
+from settings import Settings
+
+TOLERANCE = 0.005  # Balances are stored as floats; anything under half a cent is rounding
+
+# Both tiers hold approved transactions: the hot collection under full field
+# names, the archive under the short keys of server.ARCHIVE_FIELDS
+LEDGER_SOURCES = [
+    ("transactions", {field: field for field in ARCHIVE_FIELDS}),
+    ("transactions_archive", ARCHIVE_FIELDS),
+]
+
+
+def ledger_indexes(n: dict) -> list:
+    return [
+        ([(n["from_user_id"], 1), (n["from_account_type"], 1), (n["transaction_type"], 1), (n["to_account_info"], 1), (n["amount"], 1)], "ledger_debits"),
+        ([(n["to_user_id"], 1), (n["transaction_type"], 1), (n["to_account_info"], 1), (n["amount"], 1)], "ledger_credits"),
+    ]
+
+
+def credited_user(n: dict) -> dict:
+    return {"$cond": [{"$eq": [f"${n['transaction_type']}", "self"]}, f"${n['from_user_id']}", f"${n['to_user_id']}"]}
+
+
+def credited_account(n: dict) -> dict:
+    """Which of the recipient's accounts an approved transaction credits"""
+    return {
+        "$switch": {
+            "branches": [
+                {"case": {"$eq": [f"${n['transaction_type']}", "internal"]}, "then": "checking"},
+                {"case": {"$eq": [f"${n['transaction_type']}", "self"]}, "then": f"${n['to_account_info']}"},
+            ],
+            # Manual credits recorded before the account was stored went to checking
+            "default": {"$ifNull": [f"${n['to_account_info']}", "checking"]}
+        }
+    }
+
+
+def partition_bounds(partitions: int) -> List[Tuple[str, Optional[str]]]:
+    """Contiguous [lower, upper) id ranges; the last range is open so no id is missed"""
+    points = [""] + [format(i * 0x10000 // partitions, "04x") for i in range(1, partitions)] + [None]
+    return list(zip(points[:-1], points[1:]))
+
+
+def id_range(field: str, lower: str, upper: Optional[str], user_id: Optional[str] = None) -> dict:
+    if user_id is not None:
+        return {field: user_id}
+    bounds = {"$gte": lower}
+    if upper is not None:
+        bounds["$lt"] = upper
+    # "system" is the counterparty of manual credits and debits, not an account
+    bounds["$ne"] = "system"
+    return {field: bounds}
+
+
+async def expected_balances(db, lower: str, upper: Optional[str], user_id: Optional[str] = None) -> Dict[str, Dict[str, float]]:
+    expected = defaultdict(lambda: {"checking": 0.0, "savings": 0.0})
+
+    for collection, n in LEDGER_SOURCES:
+        debits = db[collection].aggregate([
+            {"$match": {n["status"]: "approved", **id_range(n["from_user_id"], lower, upper, user_id)}},
+            {"$group": {
+                "_id": {"user": f"${n['from_user_id']}", "account": f"${n['from_account_type']}"},
+                "total": {"$sum": f"${n['amount']}"}
+            }},
+        ], allowDiskUse=True)
+        async for row in debits:
+            expected[row["_id"]["user"]][row["_id"].get("account") or "checking"] -= row["total"]
+
+        credits = db[collection].aggregate([
+            {"$match": {
+                n["status"]: "approved",
+                "$or": [
+                    # Self transfers credit the sender's other account
+                    {n["transaction_type"]: "self", **id_range(n["from_user_id"], lower, upper, user_id)},
+                    {n["transaction_type"]: {"$in": ["internal", "credit"]}, **id_range(n["to_user_id"], lower, upper, user_id)},
+                ]
+            }},
+            {"$group": {"_id": {"user": credited_user(n), "account": credited_account(n)}, "total": {"$sum": f"${n['amount']}"}}},
+        ], allowDiskUse=True)
+        async for row in credits:
+            expected[row["_id"]["user"]][row["_id"]["account"]] += row["total"]
+
+    return expected
+
+
+async def find_mismatches(db, lower: str, upper: Optional[str], user_id: Optional[str] = None) -> Tuple[int, List[dict]]:
+    expected = await expected_balances(db, lower, upper, user_id)
+    users = db.users.find(
+        id_range("id", lower, upper, user_id),
+        {"_id": 0, "id": 1, "checking_balance": 1, "savings_balance": 1}
+    )
+    checked = 0
+    mismatches = []
+    async for user in users:
+        checked += 1
+        ledger = expected.pop(user["id"], {"checking": 0.0, "savings": 0.0})
+        for account in ("checking", "savings"):
+            recorded = float(user.get(f"{account}_balance", 0.0))
+            if abs(recorded - ledger[account]) > TOLERANCE:
+                mismatches.append({
+                    "user_id": user["id"],
+                    "account": account,
+                    "recorded": round(recorded, 2),
+                    "expected": round(ledger[account], 2),
+                    "difference": round(recorded - ledger[account], 2)
+                })
+    # Ledger entries whose account no longer exists
+    for orphan_id, ledger in expected.items():
+        for account, amount in ledger.items():
+            if abs(amount) > TOLERANCE:
+                mismatches.append({
+                    "user_id": orphan_id, "account": account, "recorded": None,
+                    "expected": round(amount, 2), "difference": None
+                })
+    return checked, mismatches
+
+
+async def reconcile(db, workers: int, partitions: int, report) -> dict:
+    for collection, n in LEDGER_SOURCES:
+        for keys, name in ledger_indexes(n):
+            await db[collection].create_index(keys, name=name, partialFilterExpression={n["status"]: "approved"})
+
+    stats = {"users": 0, "mismatches": 0}
+    semaphore = asyncio.Semaphore(workers)
+
+    async def run_partition(lower: str, upper: Optional[str]):
+        async with semaphore:
+            checked, mismatches = await find_mismatches(db, lower, upper)
+            stats["users"] += checked
+            for mismatch in mismatches:
+                # Confirm against a fresh read of just this account before reporting
+                if mismatch["recorded"] is not None:
+                    _, rechecked = await find_mismatches(db, lower, upper, user_id=mismatch["user_id"])
+                    mismatch = next((m for m in rechecked if m["account"] == mismatch["account"]), None)
+                    if mismatch is None:
+                        continue
+                report.write(json.dumps(mismatch) + "\n")
+                stats["mismatches"] += 1
+            report.flush()
+
+    await asyncio.gather(*(run_partition(lower, upper) for lower, upper in partition_bounds(partitions)))
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=8, help="partitions reconciled concurrently")
+    parser.add_argument("--partitions", type=int, default=64, help="number of user-id ranges")
+    parser.add_argument("--report", default=f"reconciliation-{datetime.utcnow():%Y%m%dT%H%M%S}.ndjson")
+    args = parser.parse_args()
+
+    settings = Settings.from_env()
+
+    async def run():
+        client = AsyncIOMotorClient(settings.mongo_url, **settings.mongo_client_options())
+        try:
+            started = time.perf_counter()
+            with open(args.report, "w") as report:
+                stats = await reconcile(client[settings.db_name], args.workers, args.partitions, report)
+            elapsed = time.perf_counter() - started
+        finally:
+            client.close()
+        print(f"{stats['users']} users reconciled in {elapsed:.1f}s, "
+              f"{stats['mismatches']} mismatches written to {args.report}")
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
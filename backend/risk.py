@@ -0,0 +1,179 @@
+"""Transfer velocity and risk scoring from per-user sliding-window counters"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from pymongo import UpdateOne
+
+from background import cancel_tasks
+
+logger = logging.getLogger(__name__)
+
+
+class VelocityWindow:
+    """Transfer count and amount over a sliding window of fixed-size time buckets"""
+
+    def __init__(self, bucket_seconds: int, bucket_count: int):
+        self.bucket_seconds = bucket_seconds
+        self.bucket_count = bucket_count
+        self.buckets = [0] * bucket_count  # absolute bucket number held by each slot
+        self.counts = [0] * bucket_count
+        self.amounts = [0.0] * bucket_count
+
+    def add(self, now: float, amount: float):
+        bucket = int(now // self.bucket_seconds)
+        slot = bucket % self.bucket_count
+        if self.buckets[slot] != bucket:
+            # Slot last held an expired bucket; recycle it
+            self.buckets[slot] = bucket
+            self.counts[slot] = 0
+            self.amounts[slot] = 0.0
+        self.counts[slot] += 1
+        self.amounts[slot] += amount
+
+    def totals(self, now: float):
+        oldest = int(now // self.bucket_seconds) - self.bucket_count
+        count, amount = 0, 0.0
+        for slot in range(self.bucket_count):
+            if self.buckets[slot] > oldest:
+                count += self.counts[slot]
+                amount += self.amounts[slot]
+        return count, amount
+
+    def to_doc(self):
+        return {"buckets": self.buckets, "counts": self.counts, "amounts": self.amounts}
+
+    def load(self, doc: dict):
+        if doc and len(doc.get("buckets", [])) == self.bucket_count:
+            self.buckets, self.counts, self.amounts = doc["buckets"], doc["counts"], doc["amounts"]
+
+
+class UserRiskState:
+    MAX_COUNTERPARTIES = 500
+
+    def __init__(self):
+        self.hour = VelocityWindow(60, 60)
+        self.day = VelocityWindow(3600, 24)
+        self.counterparties = OrderedDict()  # most recently paid last
+        self.updated_at = 0.0
+
+
+class RiskEngine:
+    """Scores transfers from in-memory counters; dirty counters are persisted periodically"""
+
+    def __init__(self, get_collection):
+        self.get_collection = get_collection
+        self.states = {}  # {user_id: UserRiskState}
+        self.dirty = set()
+        self.task = None
+
+    async def state_for(self, user_id: str) -> UserRiskState:
+        state = self.states.get(user_id)
+        if state is not None:
+            return state
+        # First transfer for this user in this process: one indexed lookup, never a scan
+        doc = await self.get_collection().find_one({"user_id": user_id}, {"_id": 0})
+        state = UserRiskState()
+        if doc:
+            state.hour.load(doc.get("hour"))
+            state.day.load(doc.get("day"))
+            state.counterparties = OrderedDict.fromkeys(doc.get("counterparties", []))
+            state.updated_at = doc.get("updated_at", 0.0)
+        return self.states.setdefault(user_id, state)
+
+    @staticmethod
+    def counterparty(transfer) -> Optional[str]:
+        if transfer.transaction_type == "self":
+            return None
+        if transfer.to_user_id:
+            return f"user:{transfer.to_user_id}"
+        if transfer.to_account_info:
+            return f"account:{transfer.to_account_info.strip().lower()}"
+        return None
+
+    async def score(self, user, transfer, now: float):
+        """Risk score (0-100) and human-readable reasons for a transfer about to be created"""
+        state = await self.state_for(user.id)
+        hour_count, _ = state.hour.totals(now)
+        day_count, day_amount = state.day.totals(now)
+        score, reasons = 0, []
+
+        if hour_count >= 3:
+            score += 20
+            reasons.append(f"{hour_count + 1} transfers in the last hour")
+        if day_count >= 10:
+            score += 15
+            reasons.append(f"{day_count + 1} transfers in the last 24 hours")
+        if day_amount + transfer.amount >= 10000:
+            score += 25
+            reasons.append(f"{day_amount + transfer.amount:.2f} transferred in the last 24 hours")
+        counterparty = self.counterparty(transfer)
+        if counterparty and counterparty not in state.counterparties:
+            score += 20
+            reasons.append("New counterparty")
+        balance = getattr(user, f"{transfer.from_account_type}_balance")
+        share = transfer.amount / balance if balance > 0 else 1.0
+        if share >= 0.8:
+            score += 25
+            reasons.append(f"Moves {share:.0%} of the account balance")
+        elif share >= 0.5:
+            score += 10
+            reasons.append(f"Moves {share:.0%} of the account balance")
+        if transfer.transaction_type == "international":
+            score += 10
+            reasons.append("International transfer")
+        return min(score, 100), reasons
+
+    async def record(self, user_id: str, transfer, now: float):
+        state = await self.state_for(user_id)
+        state.hour.add(now, transfer.amount)
+        state.day.add(now, transfer.amount)
+        counterparty = self.counterparty(transfer)
+        if counterparty:
+            state.counterparties[counterparty] = None
+            state.counterparties.move_to_end(counterparty)
+            while len(state.counterparties) > UserRiskState.MAX_COUNTERPARTIES:
+                state.counterparties.popitem(last=False)
+        state.updated_at = now
+        self.dirty.add(user_id)
+
+    async def persist(self):
+        dirty, self.dirty = self.dirty, set()
+        operations = [
+            UpdateOne({"user_id": user_id}, {"$set": {
+                "user_id": user_id,
+                "hour": self.states[user_id].hour.to_doc(),
+                "day": self.states[user_id].day.to_doc(),
+                "counterparties": list(self.states[user_id].counterparties),
+                "updated_at": self.states[user_id].updated_at
+            }}, upsert=True)
+            for user_id in dirty if user_id in self.states
+        ]
+        if operations:
+            try:
+                await self.get_collection().bulk_write(operations, ordered=False)
+            except Exception:
+                self.dirty |= dirty
+                logger.exception("Persisting risk counters failed")
+                return
+
+        # Users idle for a full day have nothing left in their windows worth keeping in memory
+        cutoff = time.time() - 86400
+        for user_id in [user_id for user_id, state in self.states.items()
+                        if state.updated_at < cutoff and user_id not in self.dirty]:
+            del self.states[user_id]
+
+    async def _run(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            await self.persist()
+
+    def start(self, interval: float):
+        self.task = asyncio.create_task(self._run(interval))
+
+    async def stop(self):
+        await cancel_tasks(self.task)
+        self.task = None
+        await self.persist()
@@ -0,0 +1,139 @@
+"""Scheduled and recurring transfers: a min-heap of the runs due within the next horizon"""
+import asyncio
+import calendar
+import heapq
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, List, Optional
+
+from pymongo import UpdateOne
+
+from background import cancel_tasks
+
+logger = logging.getLogger(__name__)
+
+
+SCHEDULE_FREQUENCIES = ("once", "weekly", "monthly")
+
+
+def next_schedule_run(schedule: dict, after: datetime) -> Optional[datetime]:
+    """First run strictly after `after`; runs missed while the server was down are collapsed"""
+    run_at = schedule["next_run_at"]
+    if schedule["frequency"] == "once":
+        return None
+    while run_at <= after:
+        if schedule["frequency"] == "weekly":
+            run_at += timedelta(days=7)
+        else:
+            year, month = (run_at.year + 1, 1) if run_at.month == 12 else (run_at.year, run_at.month + 1)
+            day = min(schedule["day_of_month"], calendar.monthrange(year, month)[1])
+            run_at = run_at.replace(year=year, month=month, day=day)
+    return run_at
+
+
+def scheduled_transaction_id(schedule_id: str, run_at: datetime) -> str:
+    # Deterministic, so a run repeated after a crash collides on the unique transaction id
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"scheduled-transfer:{schedule_id}:{run_at.isoformat()}"))
+
+
+class TransferScheduler:
+    """One background task keeping a min-heap of schedules due within the horizon.
+
+    create_runs(schedules, now) writes the transfers for a batch of due
+    schedules; the scheduler then advances each schedule to its next run.
+    """
+
+    def __init__(self, get_collection, create_runs: Callable[[List[dict], datetime], Awaitable[None]],
+                 horizon_seconds: int = 600, batch_size: int = 500):
+        self.get_collection = get_collection
+        self.create_runs = create_runs
+        self.horizon = timedelta(seconds=horizon_seconds)
+        self.batch_size = batch_size
+        self.heap = []  # [(next_run_at, schedule_id)]
+        self.due_at = {}  # {schedule_id: next_run_at}; heap entries that disagree are stale
+        self.loaded_until = None  # schedules due before this are all in the heap
+        self.wakeup = asyncio.Event()
+        self.task = None
+
+    def push(self, schedule_id: str, run_at: datetime):
+        # Runs beyond the horizon are picked up by a later load_horizon
+        if self.loaded_until is not None and run_at < self.loaded_until:
+            self.due_at[schedule_id] = run_at
+            heapq.heappush(self.heap, (run_at, schedule_id))
+            self.wakeup.set()
+
+    def discard(self, schedule_id: str):
+        self.due_at.pop(schedule_id, None)
+
+    async def load_horizon(self, now: datetime):
+        """Pull schedules due before the next horizon with one indexed range query"""
+        self.loaded_until = now + self.horizon
+        async for schedule in self.get_collection().find(
+            {"active": True, "next_run_at": {"$lt": self.loaded_until}}, {"_id": 0, "id": 1, "next_run_at": 1}
+        ):
+            if self.due_at.get(schedule["id"]) != schedule["next_run_at"]:
+                self.due_at[schedule["id"]] = schedule["next_run_at"]
+                heapq.heappush(self.heap, (schedule["next_run_at"], schedule["id"]))
+
+    def pop_due(self, now: datetime) -> List[str]:
+        due = []
+        while self.heap and self.heap[0][0] <= now and len(due) < self.batch_size:
+            run_at, schedule_id = heapq.heappop(self.heap)
+            if self.due_at.get(schedule_id) == run_at:
+                del self.due_at[schedule_id]
+                due.append(schedule_id)
+        return due
+
+    async def fire(self, schedule_ids: List[str], now: datetime):
+        schedules = await self.get_collection().find(
+            {"id": {"$in": schedule_ids}, "active": True, "next_run_at": {"$lte": now}}, {"_id": 0}
+        ).to_list(len(schedule_ids))
+        if not schedules:
+            return
+
+        await self.create_runs(schedules, now)
+
+        # Advance only if nobody else already did, so a run is never generated twice
+        updates = []
+        for schedule in schedules:
+            next_run_at = next_schedule_run(schedule, now)
+            update = {"$set": {"last_run_at": schedule["next_run_at"], "next_run_at": next_run_at or schedule["next_run_at"],
+                               "active": next_run_at is not None},
+                      "$inc": {"run_count": 1}}
+            updates.append(UpdateOne({"id": schedule["id"], "next_run_at": schedule["next_run_at"]}, update))
+            if next_run_at is not None:
+                self.push(schedule["id"], next_run_at)
+        await self.get_collection().bulk_write(updates, ordered=False)
+
+    async def _run(self):
+        while True:
+            now = datetime.utcnow()
+            try:
+                if self.loaded_until is None or now >= self.loaded_until - self.horizon / 2:
+                    await self.load_horizon(now)
+                due = self.pop_due(now)
+                if due:
+                    await self.fire(due, now)
+                    continue
+            except Exception:
+                logger.exception("Scheduled transfer run failed")
+                await asyncio.sleep(1)
+                continue
+
+            # Sleep until the earliest due run or the next horizon refill
+            wake_at = self.loaded_until - self.horizon / 2
+            if self.heap:
+                wake_at = min(wake_at, self.heap[0][0])
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), max((wake_at - now).total_seconds(), 0.01))
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        await cancel_tasks(self.task)
+        self.task = None
@@ -1,11 +1,22 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, BackgroundTasks, HTTPException, Depends, Header, Query, Request, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from dotenv import load_dotenv
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
-import os
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 import logging
-from pathlib import Path
+import asyncio
+import hashlib
+import math
+import random
+import secrets
+import re
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 from pydantic import BaseModel, Field, EmailStr
 from typing import List, Optional
 import uuid
@@ -13,7 +24,21 @@ from datetime import datetime, timedelta
 import jwt
 from passlib.context import CryptContext
 import json
+import base64
 from bson import ObjectId
+import numpy as np
+from settings import Settings
+from profiling import RequestProfiler, RequestTimings, current_timings, stage
+from outbox import NDJSONFileSink, OutboxRelay, append_event
+from account_locks import AccountLocks
+from live_events import ChangeStreamSource, EventHub
+from mongo_errors import is_duplicate_key_error
+from timestamps import as_naive_utc
+from risk import RiskEngine
+from scheduler import SCHEDULE_FREQUENCIES, TransferScheduler, scheduled_transaction_id
+from auto_approval import AutoApprover
+from recent_transactions import RECENT_TRANSACTIONS_SIZE, RecentTransactionsCache
+from analytics_cache import AnalyticsCache
 
 # Custom JSON encoder to handle ObjectId
 class JSONEncoder(json.JSONEncoder):
@@ -22,13 +47,12 @@ class JSONEncoder(json.JSONEncoder):
             return str(o)
         return super().default(o)
 
-ROOT_DIR = Path(__file__).parent
-load_dotenv(ROOT_DIR / '.env')
+settings = Settings.from_env()
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# MongoDB connection, opened in the app lifespan
+client = None
+db = None
+reporting_db = None  # same database, read preference for admin list endpoints
 
 # Add a blacklisted tokens set for force logout functionality
 blacklisted_tokens = set()
@@ -39,18 +63,376 @@ active_sessions = {}  # {user_id: {'token': token, 'last_activity': datetime, 'l
 # Add pending login approvals tracking
 pending_login_approvals = {}  # {approval_id: {'user_id': str, 'email': str, 'timestamp': datetime, 'status': 'pending'}}
 
+# Long-poll waiters on login approvals, one shared event per approval
+approval_events = {}  # {approval_id: {'event': asyncio.Event, 'waiters': int}}
+
 # Add force logout events for real-time communication
 force_logout_events = {}  # {user_id: datetime} - tracks when users should be force logged out
 
+# Idempotency-Key replay: in-process fast path and in-flight request coalescing
+IDEMPOTENCY_CACHE_SIZE = 10000
+idempotency_results = OrderedDict()  # {(scope, key): (expires_at, request_hash, response)}
+idempotency_inflight = {}  # {(scope, key): (request_hash, asyncio.Future)}
+
+# Token-bucket rate limiting, keyed per IP / email / user
+class TokenBucketLimiter:
+    """Token buckets keyed by string; a bucket idle long enough to refill is evicted"""
+    
+    def __init__(self, rate: float, capacity: int, max_keys: int = 100000):
+        self.rate = rate  # tokens added per second
+        self.capacity = capacity
+        self.idle_seconds = capacity / rate  # after this long a bucket is full again
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()  # {key: [tokens, updated_at]}, least recently used first
+    
+    def acquire(self, key: str, now: Optional[float] = None) -> float:
+        """Take one token; return 0 if allowed, otherwise seconds until one is available"""
+        now = time.monotonic() if now is None else now
+        self._evict_idle(now)
+        
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            tokens = self.capacity
+        else:
+            tokens = min(self.capacity, bucket[0] + (now - bucket[1]) * self.rate)
+            self.buckets.move_to_end(key)
+        
+        if tokens >= 1:
+            self.buckets[key] = [tokens - 1, now]
+            return 0
+        self.buckets[key] = [tokens, now]
+        return (1 - tokens) / self.rate
+    
+    def _evict_idle(self, now: float):
+        # Buckets are kept in access order, so idle ones are always at the front
+        while self.buckets:
+            key, (tokens, updated_at) = next(iter(self.buckets.items()))
+            if now - updated_at < self.idle_seconds and len(self.buckets) <= self.max_keys:
+                break
+            self.buckets.popitem(last=False)
+
+# Per-route policies: {policy: {key kind: limiter}}
+RATE_LIMIT_POLICIES = {
+    "login": {
+        "ip": TokenBucketLimiter(rate=1, capacity=10),
+        "email": TokenBucketLimiter(rate=5 / 60, capacity=5),
+    },
+    "poll": {
+        "ip": TokenBucketLimiter(rate=20, capacity=60),
+        "user": TokenBucketLimiter(rate=2, capacity=10),
+    },
+}
+
+# Micro-batching of transaction inserts
+class InsertBatcher:
+    """Collects documents for a few milliseconds (or up to max_batch) and writes them with one insert_many"""
+    
+    def __init__(self, get_collection, max_batch: int = 50, window_ms: float = 5):
+        self.get_collection = get_collection
+        self.max_batch = max_batch
+        self.window = window_ms / 1000
+        self.pending = []  # [(document, future)]
+        self.flush_handle = None
+    
+    async def insert(self, document: dict):
+        """Queue a document and wait until its own write succeeded or failed"""
+        if self.max_batch <= 1 or self.window <= 0:
+            await self.get_collection().insert_one(document)
+            return
+        
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((document, future))
+        if len(self.pending) >= self.max_batch:
+            self._schedule_flush(loop, 0)
+        elif self.flush_handle is None:
+            self._schedule_flush(loop, self.window)
+        await future
+    
+    def _schedule_flush(self, loop, delay: float):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+        self.flush_handle = loop.call_later(delay, lambda: asyncio.ensure_future(self.flush()))
+    
+    async def flush(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        batch, self.pending = self.pending[:self.max_batch], self.pending[self.max_batch:]
+        if self.pending:
+            self._schedule_flush(asyncio.get_running_loop(), 0)
+        if not batch:
+            return
+        
+        failures = {}
+        try:
+            await self.get_collection().insert_many([document for document, _ in batch], ordered=False)
+        except BulkWriteError as e:
+            # Unordered inserts report exactly which documents failed
+            for error in e.details.get("writeErrors", []):
+                failures[error["index"]] = error
+        except Exception as e:
+            failures = {index: e for index in range(len(batch))}
+        
+        for index, (_, future) in enumerate(batch):
+            if future.done():
+                continue
+            failure = failures.get(index)
+            if failure is None:
+                future.set_result(None)
+            elif isinstance(failure, Exception):
+                future.set_exception(failure)
+            else:
+                future.set_exception(BulkWriteError({"writeErrors": [failure]}))
+
+transaction_batcher = InsertBatcher(
+    lambda: db.transactions,
+    max_batch=settings.transaction_batch_max_size,
+    window_ms=settings.transaction_batch_window_ms
+)
+
+# Audit log: admin actions are queued in-process and appended to the audit_log collection in batches
+class AuditLog:
+    """Bounded queue of audit events drained by one background task"""
+    
+    def __init__(self, get_collection, queue_size: int = 10000, batch_size: int = 500,
+                 flush_interval_ms: float = 500, enqueue_timeout_ms: float = 100):
+        self.get_collection = get_collection
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.enqueue_timeout = enqueue_timeout_ms / 1000
+        self.queue = None
+        self.task = None
+        self.stopping = False
+        self.dropped = 0
+    
+    def start(self):
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.stopping = False
+        self.task = asyncio.create_task(self._run())
+    
+    async def record(self, admin_user, action: str, **details):
+        """Queue an event; only waits (briefly) when the queue is full"""
+        if self.queue is None:
+            logger.warning(f"Audit log not started, event not recorded: {action}")
+            return
+        event = {
+            "id": str(uuid.uuid4()),
+            "timestamp": datetime.utcnow(),
+            "admin_id": admin_user.id,
+            "admin_email": admin_user.email,
+            "action": action,
+            **details
+        }
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            try:
+                await asyncio.wait_for(self.queue.put(event), self.enqueue_timeout)
+            except asyncio.TimeoutError:
+                self.dropped += 1
+                logger.error(f"Audit queue full, dropped event: {event}")
+    
+    async def _run(self):
+        while True:
+            event = await self.queue.get()
+            if event is None:
+                return
+            batch = [event]
+            # Give the batch a moment to fill before writing
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    event = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if event is None:
+                    await self._write(batch)
+                    return
+                batch.append(event)
+            await self._write(batch)
+    
+    async def _write(self, batch):
+        while True:
+            try:
+                await self.get_collection().insert_many(batch, ordered=False)
+                return
+            except BulkWriteError as e:
+                # Event ids are unique, so duplicates mean an earlier attempt got through
+                if is_duplicate_key_error(e):
+                    return
+                logger.exception("Audit log write failed")
+            except Exception:
+                logger.exception("Audit log write failed")
+            if self.stopping:
+                logger.error(f"Giving up on {len(batch)} audit events at shutdown")
+                return
+            await asyncio.sleep(1)
+    
+    async def stop(self):
+        """Write everything still queued, then stop the background task"""
+        if self.task is None:
+            return
+        self.stopping = True
+        # The sentinel sits behind every queued event, so they are all written first
+        await self.queue.put(None)
+        await self.task
+        self.task = None
+
+audit_log = AuditLog(lambda: db.audit_log)
+
+# Live dashboard events: every committed transaction is fanned out to the open
+# streams of the users it touches, with balance deltas once it is approved
+def transaction_events(transaction: dict) -> list:
+    """[(user_id, event)] for a transaction in its current state"""
+    summary = {field: transaction.get(field) for field in TRANSACTION_SUMMARY_FIELDS}
+    summary["amount"] = format_monetary_value(summary["amount"])
+    events = [
+        (user_id, {"type": "transaction", "transaction": summary})
+        for user_id in {transaction["from_user_id"], transaction.get("to_user_id")} - {None, "system"}
+    ]
+    if transaction.get("status") != "approved":
+        return events
+    
+    # Same account rules as the approval path
+    amount = float(transaction["amount"])
+    transaction_type = transaction["transaction_type"]
+    deltas = []
+    if transaction_type != "credit":
+        deltas.append((transaction["from_user_id"], transaction.get("from_account_type") or "checking", -amount))
+    if transaction_type == "internal" and transaction.get("to_user_id"):
+        deltas.append((transaction["to_user_id"], "checking", amount))
+    elif transaction_type == "self":
+        deltas.append((transaction["from_user_id"], transaction["to_account_info"], amount))
+    elif transaction_type == "credit":
+        deltas.append((transaction["to_user_id"], transaction.get("to_account_info") or "checking", amount))
+    events += [
+        (user_id, {"type": "balance", "account": account, "delta": format_monetary_value(delta),
+                   "transaction_id": transaction["id"]})
+        for user_id, account, delta in deltas if user_id != "system"
+    ]
+    return events
+
+def fan_out_transaction(transaction: dict):
+    recent_transactions_cache.apply(transaction)
+    for user_id, event in transaction_events(transaction):
+        event_hub.publish(user_id, event)
+
+def publish_transaction(transaction: dict):
+    """Called once a transaction write commits; with the change stream source the stream does this instead.
+    
+    Also keeps the dashboard's recent-transactions cache current, so every
+    insert and status change must come through here. Never raises: the
+    caller's writes are already committed.
+    """
+    if settings.live_events_source == "local":
+        try:
+            fan_out_transaction(transaction)
+        except Exception:
+            logger.exception(f"Publishing transaction {transaction.get('id')} failed")
+            recent_transactions_cache.forget(transaction)
+
+event_hub = EventHub()
+transaction_change_source = ChangeStreamSource(lambda: db.transactions, fan_out_transaction)
+
+# Balance mutations on the same account run one at a time
+account_locks = AccountLocks()
+
+# Approval events for downstream systems, relayed from db.outbox. The write that
+# settles a transaction (or inserts a manual one) also stamps outbox_pending, so
+# an approval whose event append never happened is found and appended by the sweep.
+outbox_relay = OutboxRelay(lambda: db, sweep=lambda: recover_approval_events())
+OUTBOX_TRANSACTION_FIELDS = [
+    "id", "from_user_id", "from_account_type", "to_user_id", "to_account_info", "amount",
+    "transaction_type", "description", "status", "created_at", "approved_at",
+]
+
+def approval_event_id(transaction_id: str) -> str:
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"transaction.approved:{transaction_id}"))
+
+async def record_approval_event(transaction: dict):
+    """Queue a transaction.approved event; the id is fixed per transaction so retries dedupe"""
+    try:
+        await append_event(
+            db,
+            approval_event_id(transaction["id"]),
+            "transaction.approved",
+            {field: transaction.get(field) for field in OUTBOX_TRANSACTION_FIELDS}
+        )
+        await db.transactions.update_one({"id": transaction["id"]}, {"$unset": {"outbox_pending": ""}})
+    except Exception:
+        # The approval itself is committed; recover_approval_events appends the event later
+        logger.exception(f"Recording approval event for {transaction['id']} failed")
+        return
+    outbox_relay.notify()
+
+async def recover_approval_events():
+    """Append events for approvals still marked outbox_pending well after they were settled"""
+    cutoff = datetime.utcnow() - timedelta(seconds=settings.outbox_gap_timeout_seconds)
+    async for transaction in db.transactions.find(
+        {"outbox_pending": {"$lt": cutoff}}, {"_id": 0}
+    ).limit(settings.outbox_batch_size):
+        # Appended but not unmarked: appending again would only burn a sequence number
+        if await db.outbox.find_one({"id": approval_event_id(transaction["id"])}, {"_id": 1}):
+            await db.transactions.update_one({"id": transaction["id"]}, {"$unset": {"outbox_pending": ""}})
+        else:
+            logger.warning(f"Recovering approval event for {transaction['id']}")
+            await record_approval_event(transaction)
+
+# Transfer velocity and risk scoring from per-user sliding-window counters
+risk_engine = RiskEngine(lambda: db.risk_counters)
+
+# Scheduled and recurring transfers
+async def create_scheduled_transactions(schedules: List[dict], now: datetime):
+    """Insert the pending transfers for a batch of due schedule runs"""
+    # Scored like any other transfer, against the sender's balances at run time
+    senders = {
+        user["id"]: Principal(user)
+        async for user in db.users.find(
+            {"id": {"$in": list({schedule["user_id"] for schedule in schedules})}}, Principal.AUTH_PROJECTION
+        )
+    }
+    scored_at = time.time()
+    transfers, transactions = [], []
+    for schedule in schedules:
+        transfer = TransactionCreate(**{field: schedule.get(field) for field in TransactionCreate.model_fields})
+        sender = senders.get(schedule["user_id"]) or Principal({"id": schedule["user_id"]})
+        risk_score, risk_reasons = await risk_engine.score(sender, transfer, scored_at)
+        transfers.append(transfer)
+        transactions.append(Transaction(
+            id=scheduled_transaction_id(schedule["id"], schedule["next_run_at"]),
+            from_user_id=schedule["user_id"],
+            risk_score=risk_score,
+            risk_reasons=risk_reasons,
+            created_at=now,
+            **transfer.dict()
+        ).dict())
+    duplicates = set()
+    try:
+        await db.transactions.insert_many(transactions, ordered=False)
+    except BulkWriteError as e:
+        # Duplicate ids are runs already generated before a restart
+        if not is_duplicate_key_error(e):
+            raise
+        duplicates = {error["index"] for error in e.details["writeErrors"]}
+    for index, (transfer, transaction) in enumerate(zip(transfers, transactions)):
+        if index not in duplicates:
+            await risk_engine.record(transaction["from_user_id"], transfer, scored_at)
+        publish_transaction(transaction)
+        invalidate_analytics_for(transaction["amount"])  # pending_outflow
+    auto_approver.notify()
+
+transfer_scheduler = TransferScheduler(lambda: db.scheduled_transfers, create_scheduled_transactions)
+
 # Security
 security = HTTPBearer()
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-SECRET_KEY = os.environ.get('SECRET_KEY', 'your-secret-key-change-this-in-production')
 ALGORITHM = "HS256"
 
-# Create the main app without a prefix
-app = FastAPI()
-
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
@@ -70,6 +452,39 @@ class User(BaseModel):
     savings_balance: float = 0.00
     account_frozen: bool = False
 
+class Principal:
+    """The authenticated caller: just the fields auth and handlers read, with the full profile on demand"""
+    __slots__ = ("id", "email", "role", "checking_balance", "savings_balance", "is_approved", "account_frozen",
+                 "has_archived_transactions", "transactions_changed_at", "_profile")
+    
+    # What get_current_user loads; ssn, tin, address and the password hash stay in the database
+    AUTH_PROJECTION = {
+        "_id": 0, "id": 1, "email": 1, "role": 1, "checking_balance": 1, "savings_balance": 1,
+        "is_approved": 1, "account_frozen": 1, "force_logout_at": 1, "has_archived_transactions": 1,
+        "transactions_changed_at": 1,
+    }
+    
+    def __init__(self, user: dict):
+        self.id = user["id"]
+        self.email = user.get("email", "")
+        self.role = user.get("role", "customer")
+        self.checking_balance = float(user.get("checking_balance", 0.0))
+        self.savings_balance = float(user.get("savings_balance", 0.0))
+        self.is_approved = bool(user.get("is_approved", False))
+        self.account_frozen = bool(user.get("account_frozen", False))
+        self.has_archived_transactions = bool(user.get("has_archived_transactions", False))  # set by archive_transactions.py
+        self.transactions_changed_at = user.get("transactions_changed_at")  # set by jobs writing transactions directly
+        self._profile = None
+    
+    async def profile(self) -> "User":
+        """Full, validated User model, loaded once per request on first use"""
+        if self._profile is None:
+            user = await db.users.find_one({"id": self.id})
+            if user is None:
+                raise HTTPException(status_code=404, detail="User not found")
+            self._profile = User(**user)
+        return self._profile
+
 class UserSignup(BaseModel):
     email: EmailStr
     password: str
@@ -97,6 +512,12 @@ class Transaction(BaseModel):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     approved_at: Optional[datetime] = None
     admin_notes: Optional[str] = None
+    risk_score: int = 0  # 0-100, computed when the transfer is created
+    risk_reasons: List[str] = []
+    priority: int = 0  # Higher values are claimed first from the pending queue; set by admins
+    lease_owner: Optional[str] = None  # Admin id currently working this transaction
+    lease_expires_at: Optional[datetime] = None
+    auto_reviewed: bool = False  # Auto-approval rules have already been evaluated
     
     class Config:
         json_encoders = {
@@ -111,6 +532,32 @@ class TransactionCreate(BaseModel):
     transaction_type: str
     description: str
 
+class ClaimRequest(BaseModel):
+    limit: int = Field(default=10, ge=1, le=100)
+    lease_seconds: int = Field(default=300, ge=10, le=3600)
+    order: str = "oldest"  # "oldest" or "priority"
+
+class ScheduledTransferCreate(TransactionCreate):
+    frequency: str = "once"  # "once", "weekly" or "monthly"
+    start_at: datetime  # first run, UTC
+
+class ScheduledTransfer(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    user_id: str
+    from_account_type: str = "checking"
+    to_user_id: Optional[str] = None
+    to_account_info: Optional[str] = None
+    amount: float
+    transaction_type: str
+    description: str
+    frequency: str = "once"
+    day_of_month: int  # monthly runs keep this day, clamped to short months
+    next_run_at: datetime
+    last_run_at: Optional[datetime] = None
+    run_count: int = 0
+    active: bool = True
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
 class AdminAction(BaseModel):
     user_id: str
     action: str  # "approve", "decline", "freeze", "unfreeze", "credit", "debit"
@@ -132,6 +579,18 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+async def rehash_password(user_id: str, old_hash: str, password: str):
+    """Re-hash with the current scheme and cost; runs after the login response is sent"""
+    try:
+        new_hash = await run_in_threadpool(get_password_hash, password)
+        # Leave it alone if the password changed in the meantime
+        await db.users.update_one(
+            {"id": user_id, "hashed_password": old_hash},
+            {"$set": {"hashed_password": new_hash}}
+        )
+    except Exception:
+        logger.exception("Password rehash failed for user %s", user_id)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     now = datetime.utcnow()
@@ -140,7 +599,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     else:
         expire = now + timedelta(minutes=15)
     to_encode.update({"exp": expire, "iat": now})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    encoded_jwt = jwt.encode(to_encode, settings.secret_key, algorithm=ALGORITHM)
     return encoded_jwt
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
@@ -151,15 +610,17 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         if token in blacklisted_tokens:
             raise HTTPException(status_code=401, detail="Session terminated by administrator")
         
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        with stage("auth_jwt"):
+            payload = jwt.decode(token, settings.secret_key, algorithms=[ALGORITHM])
         user_id: str = payload.get("sub")
         if user_id is None:
             raise HTTPException(status_code=401, detail="Invalid token")
     except jwt.PyJWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
     
-    user = await db.users.find_one({"id": user_id})
-    if user is None:
+    with stage("auth_user_lookup"):
+        user = await db.users.find_one({"id": user_id}, Principal.AUTH_PROJECTION)
+    if user is None or not isinstance(user.get("id"), str):
         raise HTTPException(status_code=401, detail="User not found")
     
     # Check if user has been force logged out
@@ -175,13 +636,518 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     if user_id in active_sessions:
         active_sessions[user_id]["last_activity"] = datetime.utcnow()
     
-    return User(**user)
+    with stage("auth_principal"):
+        return Principal(user)
 
-async def get_admin_user(current_user: User = Depends(get_current_user)):
+async def get_admin_user(current_user: Principal = Depends(get_current_user)):
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     return current_user
 
+def remember_idempotent_result(cache_key, expires_at, request_hash, response):
+    idempotency_results[cache_key] = (expires_at, request_hash, response)
+    idempotency_results.move_to_end(cache_key)
+    while len(idempotency_results) > IDEMPOTENCY_CACHE_SIZE:
+        idempotency_results.popitem(last=False)
+
+def idempotency_request_hash(body: BaseModel) -> str:
+    return hashlib.sha256(json.dumps(body.dict(), sort_keys=True, default=str).encode()).hexdigest()
+
+def check_idempotent_request(stored_hash: Optional[str], request_hash: str):
+    # Records written before request hashes were stored have none to compare against
+    if stored_hash is not None and stored_hash != request_hash:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request body")
+
+async def run_idempotent(scope: str, key: Optional[str], body: BaseModel, handler):
+    """Run handler once per (scope, Idempotency-Key) and replay its result for retries of the same body.
+    
+    handler is called with an operation id, fixed per key, and must be safe to
+    re-run with it: a claim whose holder crashed or failed mid-write is taken
+    over by the next retry once its lease lapses. handler may only raise
+    HTTPException before it has written anything; those attempts are forgotten.
+    """
+    if not key:
+        return await handler(str(uuid.uuid4()))
+    
+    cache_key = (scope, key)
+    request_hash = idempotency_request_hash(body)
+    operation_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f"idempotency:{scope}:{key}"))
+    now = datetime.utcnow()
+    
+    # Fast path: result already known to this process
+    cached = idempotency_results.get(cache_key)
+    if cached:
+        if cached[0] > now:
+            check_idempotent_request(cached[1], request_hash)
+            return cached[2]
+        del idempotency_results[cache_key]
+    
+    # Concurrent duplicate in this process: wait for the first request to finish
+    if cache_key in idempotency_inflight:
+        inflight_hash, inflight = idempotency_inflight[cache_key]
+        check_idempotent_request(inflight_hash, request_hash)
+        return await asyncio.shield(inflight)
+    
+    future = asyncio.get_running_loop().create_future()
+    idempotency_inflight[cache_key] = (request_hash, future)
+    try:
+        expires_at = now + timedelta(seconds=settings.idempotency_ttl_seconds)
+        locked_until = now + timedelta(seconds=settings.idempotency_lease_seconds)
+        try:
+            # The unique (scope, key) index makes this the cross-worker claim
+            await db.idempotency_keys.insert_one({
+                "scope": scope,
+                "key": key,
+                "status": "in_progress",
+                "request_hash": request_hash,
+                "created_at": now,
+                "locked_until": locked_until,
+                "expires_at": expires_at
+            })
+        except DuplicateKeyError:
+            record = await db.idempotency_keys.find_one({"scope": scope, "key": key})
+            if record:
+                check_idempotent_request(record.get("request_hash"), request_hash)
+            if record and record["status"] == "completed":
+                remember_idempotent_result(cache_key, record["expires_at"], record.get("request_hash"), record["response"])
+                future.set_result(record["response"])
+                return record["response"]
+            # Take over a claim whose lease lapsed; the conditional update lets only one retry win
+            taken_over = record is not None and record.get("locked_until", record["expires_at"]) <= now and (
+                await db.idempotency_keys.update_one(
+                    {"_id": record["_id"], "status": "in_progress", "locked_until": record.get("locked_until")},
+                    {"$set": {"locked_until": locked_until}}
+                )
+            ).modified_count == 1
+            if not taken_over:
+                raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still being processed")
+        
+        try:
+            response = await handler(operation_id)
+        except HTTPException:
+            # Rejected before writing anything, so the client may retry from scratch
+            await db.idempotency_keys.delete_one({"scope": scope, "key": key, "status": "in_progress"})
+            raise
+        except Exception:
+            # May have written part of the operation: let the next retry take over and finish it
+            await db.idempotency_keys.update_one(
+                {"scope": scope, "key": key, "status": "in_progress"},
+                {"$set": {"locked_until": datetime.utcnow()}}
+            )
+            raise
+        
+        await db.idempotency_keys.update_one(
+            {"scope": scope, "key": key},
+            {"$set": {"status": "completed", "response": response}}
+        )
+        remember_idempotent_result(cache_key, expires_at, request_hash, response)
+        future.set_result(response)
+        return response
+    except Exception as e:
+        if not future.done():
+            future.set_exception(e)
+            # Mark retrieved so an unobserved failure doesn't log a warning
+            future.exception()
+        raise
+    finally:
+        del idempotency_inflight[cache_key]
+
+def client_ip(request: Request) -> Optional[str]:
+    # Hops left of those our own proxies appended are whatever the client sent, so never trust them
+    proxies = settings.trusted_proxy_count
+    if proxies:
+        hops = [hop.strip() for hop in request.headers.get("x-forwarded-for", "").split(",") if hop.strip()]
+        if len(hops) >= proxies:
+            return hops[-proxies]
+    return request.client.host if request.client else None
+
+def enforce_rate_limit(policy: str, keys: dict):
+    """Raise 429 if any of the keyed buckets for this policy is empty"""
+    limiters = RATE_LIMIT_POLICIES[policy]
+    for kind, value in keys.items():
+        if not value:
+            continue
+        retry_after = limiters[kind].acquire(f"{kind}:{value}")
+        if retry_after:
+            raise HTTPException(
+                status_code=429,
+                detail="Too many requests",
+                headers={"Retry-After": str(math.ceil(retry_after))}
+            )
+
+async def poll_rate_limit(request: Request):
+    """Throttle polling endpoints per IP and per token subject, before any database work"""
+    user_id = None
+    authorization = request.headers.get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        try:
+            user_id = jwt.decode(authorization[7:], settings.secret_key, algorithms=[ALGORITHM]).get("sub")
+        except jwt.PyJWTError:
+            pass  # get_current_user will reject the token
+    enforce_rate_limit("poll", {"ip": client_ip(request), "user": user_id})
+
+def notify_approval_decision(approval_id: str):
+    """Wake every long-poll waiter on this approval"""
+    entry = approval_events.pop(approval_id, None)
+    if entry:
+        entry["event"].set()
+
+async def wait_for_approval_decision(approval_id: str, timeout: float):
+    entry = approval_events.setdefault(approval_id, {"event": asyncio.Event(), "waiters": 0})
+    entry["waiters"] += 1
+    try:
+        await asyncio.wait_for(entry["event"].wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        entry["waiters"] -= 1
+        # Drop the event once nobody is waiting and no decision has arrived
+        if entry["waiters"] == 0 and approval_events.get(approval_id) is entry:
+            del approval_events[approval_id]
+
+# Field selection (?fields=a,b,c): per-endpoint allow-lists and slim defaults.
+# hashed_password is never selectable; "id" is always returned.
+USER_FIELDS = {
+    "id", "email", "full_name", "ssn", "tin", "phone", "address", "role", "is_approved",
+    "created_at", "checking_balance", "savings_balance", "account_frozen", "force_logout_at",
+}
+USER_SUMMARY_FIELDS = [
+    "id", "email", "full_name", "phone", "role", "is_approved", "created_at",
+    "checking_balance", "savings_balance", "account_frozen",
+]
+TRANSACTION_FIELDS = set(Transaction.model_fields)
+TRANSACTION_SUMMARY_FIELDS = [
+    "id", "from_user_id", "from_account_type", "to_user_id", "to_account_info", "amount",
+    "transaction_type", "description", "status", "created_at", "approved_at",
+]
+FIELD_SETS = {
+    # endpoint: (allowed, default)
+    "dashboard.user": (USER_FIELDS - {"ssn", "tin"}, [
+        "id", "email", "full_name", "role", "is_approved", "created_at",
+        "checking_balance", "savings_balance", "account_frozen",
+    ]),
+    "dashboard.transactions": (TRANSACTION_FIELDS, TRANSACTION_SUMMARY_FIELDS),
+    "transactions": (TRANSACTION_FIELDS, TRANSACTION_SUMMARY_FIELDS),
+    "admin.pending-users": (USER_FIELDS, USER_SUMMARY_FIELDS + ["ssn", "tin", "address"]),
+    "admin.pending-transactions": (TRANSACTION_FIELDS, TRANSACTION_SUMMARY_FIELDS + [
+        "risk_score", "risk_reasons", "priority", "lease_owner", "lease_expires_at",
+    ]),
+    "admin.users": (USER_FIELDS, USER_SUMMARY_FIELDS),
+}
+
+def field_projection(endpoint: str, fields: Optional[str]) -> dict:
+    """Translate a ?fields= value into a Mongo projection, rejecting fields outside the allow-list"""
+    allowed, default = FIELD_SETS[endpoint]
+    if fields is None:
+        selected = default
+    else:
+        selected = [field.strip() for field in fields.split(",") if field.strip()]
+        disallowed = sorted(set(selected) - allowed)
+        if disallowed:
+            raise HTTPException(status_code=400, detail=f"Unknown or disallowed fields: {', '.join(disallowed)}")
+    
+    projection = {field: 1 for field in selected}
+    projection["id"] = 1
+    projection["_id"] = 0
+    return projection
+
+def format_transaction_amounts(transactions):
+    for transaction in transactions:
+        if 'amount' in transaction:
+            transaction['amount'] = format_monetary_value(transaction['amount'])
+    return transactions
+
+# Settled transactions older than archive_after_days move to transactions_archive
+# (see archive_transactions.py) under short keys, with queue-only fields and
+# empty values dropped. The transaction id becomes _id, so no extra id index.
+ARCHIVE_FIELDS = {
+    "id": "_id", "from_user_id": "f", "from_account_type": "fa", "to_user_id": "t",
+    "to_account_info": "ti", "amount": "a", "transaction_type": "y", "description": "d",
+    "status": "s", "created_at": "c", "approved_at": "p", "admin_notes": "n",
+    "risk_score": "r", "risk_reasons": "rr",
+}
+ARCHIVE_DEFAULTS = {"risk_score": 0, "risk_reasons": []}
+SETTLED_STATUSES = ["approved", "declined"]
+ARCHIVE_INDEXES = [
+    ([("f", 1), ("c", -1)], "archive_from_user"),
+    ([("t", 1), ("c", -1)], "archive_to_user"),
+    ([("c", -1), ("_id", -1)], "archive_created"),  # ops queries, in keyset order
+]
+
+def compact_transaction(transaction: dict) -> dict:
+    return {
+        short: transaction[field] for field, short in ARCHIVE_FIELDS.items()
+        if transaction.get(field) not in (None, [], 0) or field == "amount"
+    }
+
+def expand_transaction(archived: dict, projection: dict) -> dict:
+    """Rebuild the hot-collection shape for the fields in a find() projection"""
+    fields = [field for field, include in projection.items() if include and field in ARCHIVE_FIELDS]
+    return {field: archived.get(ARCHIVE_FIELDS[field], ARCHIVE_DEFAULTS.get(field)) for field in fields}
+
+def archive_filter(query):
+    """A transactions filter rewritten against the archive's short keys"""
+    if isinstance(query, list):
+        return [archive_filter(clause) for clause in query]
+    if not isinstance(query, dict):
+        return query
+    return {key if key.startswith("$") else ARCHIVE_FIELDS[key]: archive_filter(value) for key, value in query.items()}
+
+async def find_user_transactions(user: "Principal", projection: dict, limit: int) -> List[dict]:
+    """A user's newest transactions; the archive is only read when the hot tier runs short"""
+    user_id = user.id
+    transactions = await db.transactions.find({
+        "$or": [
+            {"from_user_id": user_id},
+            {"to_user_id": user_id}
+        ]
+    }, {**projection, "created_at": 1}).sort("created_at", -1).limit(limit).to_list(limit)
+    
+    # Archived rows are all older than the cutoff, so a full page newer than it is complete
+    # Users the archive job never touched have nothing there, which is most of them
+    archive_cutoff = datetime.utcnow() - timedelta(days=settings.archive_after_days)
+    if user.has_archived_transactions and (len(transactions) < limit or transactions[-1]["created_at"] < archive_cutoff):
+        archive_projection = {ARCHIVE_FIELDS[field]: 1 for field in projection if field in ARCHIVE_FIELDS}
+        archive_projection["c"] = 1
+        archived = await db.transactions_archive.find({
+            "$or": [
+                {"f": user_id},
+                {"t": user_id}
+            ]
+        }, archive_projection).sort("c", -1).limit(limit).to_list(limit)
+        
+        # Old pending rows stay hot, so merge instead of appending; skip rows caught mid-move
+        seen = {transaction["id"] for transaction in transactions}
+        transactions += [
+            {**expand_transaction(row, projection), "created_at": row["c"]}
+            for row in archived if row["_id"] not in seen
+        ]
+        transactions.sort(key=lambda transaction: transaction["created_at"], reverse=True)
+        transactions = transactions[:limit]
+    
+    if not projection.get("created_at"):
+        for transaction in transactions:
+            del transaction["created_at"]
+    return transactions
+
+# Dashboard recent activity: per-user buffers of the newest transactions, kept
+# current write-through by every insert and status change (fan_out_transaction).
+# In "local" live events mode only this worker's writes reach its buffers, so the
+# TTL is short there (see Settings.recent_transactions_cache_ttl). Jobs that write
+# transactions directly stamp the user's transactions_changed_at, which drops
+# buffers filled before it on the next dashboard load.
+RECENT_TRANSACTIONS_PROJECTION = {**{field: 1 for field in TRANSACTION_FIELDS}, "_id": 0}
+
+recent_transactions_cache = RecentTransactionsCache()
+
+# Customer search: each user carries normalized search fields, so every match kind
+# is an indexed lookup. search_keys holds every suffix of every token (substring
+# matches become anchored regexes), search_tokens the tokens themselves (word
+# prefixes) and search_fields the whole email, name and phone (field prefixes).
+# Results within a match kind are ordered by search_name, the lower-cased name;
+# the (search_name, id) index lets broad queries walk names in order and stop
+# at the page instead of sorting every match.
+SEARCH_MIN_KEY_LENGTH = 2
+SEARCH_VERSION = 2  # bump when the derived fields change, then run backfill_search_fields.py
+SEARCH_MAX_RESULTS = 1000  # matches counted and pageable per query
+
+def customer_search_fields_of(user: dict) -> List[str]:
+    return [
+        user.get("email", "").lower(),
+        user.get("full_name", "").lower(),
+        re.sub(r"\D", "", user.get("phone", "")),
+    ]
+
+def customer_search_tokens(user: dict) -> List[str]:
+    email, full_name, phone_digits = customer_search_fields_of(user)
+    local_part, _, domain = email.partition("@")
+    tokens = [email, local_part, domain] + re.split(r"[._+\-]+", local_part) + domain.split(".")
+    tokens += [full_name] + re.split(r"[\s\-'.]+", full_name)
+    tokens.append(phone_digits)
+    return sorted({token for token in tokens if token})
+
+def customer_search_document(user: dict) -> dict:
+    """The derived search fields to store on a user document"""
+    tokens = customer_search_tokens(user)
+    keys = set()
+    for token in tokens:
+        keys.update(token[i:] for i in range(len(token) - SEARCH_MIN_KEY_LENGTH + 1))
+    return {
+        "search_keys": sorted(keys),
+        "search_tokens": tokens,
+        "search_fields": [field for field in customer_search_fields_of(user) if field],
+        "search_name": user.get("full_name", "").lower(),
+        "search_version": SEARCH_VERSION,
+    }
+
+def normalize_search_query(q: str) -> List[str]:
+    """Lower-cased query words; phone-like queries collapse to their digits"""
+    q = q.strip().lower()
+    if re.fullmatch(r"[\d\s()+\-.]+", q):
+        return [re.sub(r"\D", "", q)]
+    return [word for word in q.split() if word]
+
+def customer_search_tiers(words: List[str]) -> List[dict]:
+    """Disjoint filters, best match first: exact field, field prefix, every word a token prefix, every word a substring"""
+    query = " ".join(words)
+    prefix = {"$regex": f"^{re.escape(query)}"}
+    all_word_prefixes = {"$and": [{"search_tokens": {"$regex": f"^{re.escape(word)}"}} for word in words]}
+    return [
+        {"search_fields": query},
+        {"search_fields": {**prefix, "$ne": query}},
+        {**all_word_prefixes, "search_fields": {"$not": prefix}},
+        {"$and": [{"search_keys": {"$regex": f"^{re.escape(word)}"}} for word in words], "$nor": [all_word_prefixes]},
+    ]
+
+# Ops transaction query: each supported filter shape has a compound index laid out
+# equality -> sort (created_at, id) -> range (amount), so results come back in
+# keyset order straight from the index. Users are matched on either side via $or,
+# which the planner serves as a merge of the two user indexes.
+TRANSACTION_QUERY_INDEXES = {
+    "ops_status_created": [("status", 1), ("created_at", -1), ("id", -1), ("amount", 1)],
+    "ops_type_status_created": [("transaction_type", 1), ("status", 1), ("created_at", -1), ("id", -1), ("amount", 1)],
+    "ops_type_created": [("transaction_type", 1), ("created_at", -1), ("id", -1), ("amount", 1)],
+    "ops_from_user_created": [("from_user_id", 1), ("created_at", -1), ("id", -1)],
+    "ops_to_user_created": [("to_user_id", 1), ("created_at", -1), ("id", -1)],
+    "ops_created": [("created_at", -1), ("id", -1)],
+}
+
+def transaction_query_index(user_id, transaction_type, status_filter) -> Optional[str]:
+    """Index for a filter shape; None for user queries, which use both user indexes"""
+    if user_id:
+        return None
+    if transaction_type and status_filter:
+        return "ops_type_status_created"
+    if transaction_type:
+        return "ops_type_created"
+    if status_filter:
+        return "ops_status_created"
+    return "ops_created"
+
+def encode_cursor(transaction: dict) -> str:
+    raw = json.dumps([transaction["created_at"].isoformat(), transaction["id"]])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str):
+    try:
+        created_at, transaction_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at), transaction_id
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+# Bank-wide analytics, cached with a stampede lock
+analytics_cache = AnalyticsCache()
+
+def invalidate_analytics_for(amount: float):
+    if amount >= settings.analytics_invalidate_amount:
+        analytics_cache.invalidate()
+
+ANALYTICS_CHUNK_SIZE = 50000
+
+async def stream_columns(collection, query: dict, columns: List[str], chunk_size: int = ANALYTICS_CHUNK_SIZE):
+    """Yield {column: numpy array} chunks so large collections never sit in memory as dicts"""
+    projection = {column: 1 for column in columns}
+    projection["_id"] = 0
+    cursor = collection.find(query, projection, batch_size=chunk_size)
+    while True:
+        documents = await cursor.to_list(chunk_size)
+        if not documents:
+            break
+        yield {column: np.array([document.get(column) for document in documents]) for column in columns}
+
+async def compute_bank_analytics() -> dict:
+    # pandas is only needed here, so keep it off the import path
+    import pandas as pd
+    
+    # Deposits by account type, summed per chunk
+    deposits = {"checking": 0.0, "savings": 0.0}
+    funded_accounts = {"checking": 0, "savings": 0}
+    async for chunk in stream_columns(reporting_db.users, {"role": "customer"}, ["checking_balance", "savings_balance"]):
+        for account_type in deposits:
+            balances = chunk[f"{account_type}_balance"].astype(float)
+            balances = balances[~np.isnan(balances)]
+            deposits[account_type] += float(balances.sum())
+            funded_accounts[account_type] += int(np.count_nonzero(balances > 0))
+    
+    # Daily approved volume over the window, grouped per chunk then combined
+    window_start = (datetime.utcnow() - timedelta(days=settings.analytics_daily_window_days)).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+    daily_parts = []
+    async for chunk in stream_columns(
+        reporting_db.transactions,
+        {"status": "approved", "approved_at": {"$gte": window_start}},
+        ["approved_at", "amount"]
+    ):
+        frame = pd.DataFrame({"day": pd.to_datetime(chunk["approved_at"]).normalize(), "amount": chunk["amount"].astype(float)})
+        daily_parts.append(frame.groupby("day")["amount"].agg(["sum", "count"]))
+    daily_volume = []
+    if daily_parts:
+        daily = pd.concat(daily_parts).groupby(level=0).sum().sort_index()
+        daily_volume = [
+            {"date": day.date().isoformat(), "volume": format_monetary_value(row["sum"]), "count": int(row["count"])}
+            for day, row in daily.iterrows()
+        ]
+    
+    # Small grouped results come straight from aggregation pipelines
+    pending = await reporting_db.transactions.aggregate([
+        {"$match": {"status": "pending"}},
+        {"$group": {"_id": None, "volume": {"$sum": "$amount"}, "count": {"$sum": 1}}}
+    ]).to_list(1)
+    by_type = await reporting_db.transactions.aggregate([
+        {"$project": {"_id": 0, "transaction_type": 1, "amount": 1}},
+        {"$unionWith": {"coll": "transactions_archive", "pipeline": [
+            {"$project": {"_id": 0, "transaction_type": "$y", "amount": "$a"}}
+        ]}},
+        {"$group": {"_id": "$transaction_type", "count": {"$sum": 1}, "volume": {"$sum": "$amount"}}},
+        {"$sort": {"_id": 1}}
+    ]).to_list(None)
+    
+    return {
+        "generated_at": datetime.utcnow().isoformat(),
+        "deposits_by_account_type": {
+            account_type: {"total": format_monetary_value(total), "funded_accounts": funded_accounts[account_type]}
+            for account_type, total in deposits.items()
+        },
+        "pending_outflow": {
+            "volume": format_monetary_value(pending[0]["volume"] if pending else 0.0),
+            "count": pending[0]["count"] if pending else 0
+        },
+        "daily_approved_volume": daily_volume,
+        "transactions_by_type": {
+            group["_id"]: {"count": group["count"], "volume": format_monetary_value(group["volume"])}
+            for group in by_type
+        }
+    }
+
+# Pending transaction queue ordering (claims and listings)
+PENDING_QUEUE_SORT = {
+    "oldest": [("created_at", 1)],
+    "priority": [("priority", -1), ("created_at", 1)],
+    "risk": [("risk_score", -1), ("created_at", 1)],
+}
+
+def lease_available_filter(now: datetime):
+    """Pending transactions that nobody holds an unexpired lease on"""
+    return {
+        "status": "pending",
+        "$or": [
+            {"lease_expires_at": None},
+            {"lease_expires_at": {"$lte": now}}
+        ]
+    }
+
+# Rule-based approval of low-risk pending transfers, recorded under a system admin
+auto_approval_actor = Principal({"id": AutoApprover.ACTOR_ID, "email": "auto-approver@system", "role": "admin"})
+auto_approver = AutoApprover(
+    lambda: db.transactions,
+    approve=lambda transaction, completed_filter, recheck: approve_pending_transaction(
+        transaction, completed_filter, auto_approval_actor, recheck=recheck
+    ),
+    available_filter=lease_available_filter,
+    claim_sort=PENDING_QUEUE_SORT["oldest"]
+)
+
 # Routes
 @api_router.get("/")
 async def root():
@@ -199,7 +1165,7 @@ async def signup(user_data: UserSignup):
         raise HTTPException(status_code=400, detail="Email already registered")
     
     # Create user
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await run_in_threadpool(get_password_hash, user_data.password)
     user_dict = user_data.dict()
     user_dict.pop("password")
     user_dict.pop("unique_code")
@@ -208,13 +1174,17 @@ async def signup(user_data: UserSignup):
     user = User(**user_dict)
     user_dict = user.dict()
     user_dict["hashed_password"] = hashed_password  # Ensure hashed_password is in the dict
+    user_dict.update(customer_search_document(user_dict))
     
     await db.users.insert_one(user_dict)
     
     return {"message": "Account created successfully. Please wait for admin approval."}
 
 @api_router.post("/login")
-async def login(user_data: UserLogin):
+async def login(user_data: UserLogin, request: Request, background_tasks: BackgroundTasks):
+    # Throttle before the user lookup and bcrypt verify
+    enforce_rate_limit("login", {"ip": client_ip(request), "email": user_data.email.lower()})
+    
     user = await db.users.find_one({"email": user_data.email})
     if not user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
@@ -225,7 +1195,8 @@ async def login(user_data: UserLogin):
         logging.error(f"User found but missing hashed_password field: {user}")
         raise HTTPException(status_code=500, detail="User account is incomplete")
     
-    if not verify_password(user_data.password, user["hashed_password"]):
+    # Hash verification is deliberately slow, so keep it off the event loop
+    if not await run_in_threadpool(verify_password, user_data.password, user["hashed_password"]):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     if not user["is_approved"]:
@@ -246,6 +1217,10 @@ async def login(user_data: UserLogin):
         "login_time": datetime.utcnow()
     }
     
+    # Upgrade hashes made with an older scheme or cost once the response is out
+    if pwd_context.needs_update(user["hashed_password"]):
+        background_tasks.add_task(rehash_password, user["id"], user["hashed_password"], user_data.password)
+    
     return {
         "access_token": access_token,
         "token_type": "bearer",
@@ -259,51 +1234,59 @@ async def login(user_data: UserLogin):
         }
     }
 
-@api_router.get("/dashboard")
-async def get_dashboard(current_user: User = Depends(get_current_user)):
+@api_router.get("/dashboard", dependencies=[Depends(poll_rate_limit)])
+async def get_dashboard(
+    current_user: Principal = Depends(get_current_user),
+    fields: Optional[str] = None,
+    transaction_fields: Optional[str] = None
+):
     # Get fresh user data to ensure current balances
-    fresh_user = await db.users.find_one({"id": current_user.id})
+    with stage("db_user"):
+        fresh_user = await db.users.find_one({"id": current_user.id}, field_projection("dashboard.user", fields))
     if not fresh_user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    # Convert ObjectId to string
-    if '_id' in fresh_user:
-        fresh_user['_id'] = str(fresh_user['_id'])
-    
     # Format monetary values
-    fresh_user['checking_balance'] = format_monetary_value(fresh_user.get('checking_balance', 0))
-    fresh_user['savings_balance'] = format_monetary_value(fresh_user.get('savings_balance', 0))
+    for balance_field in ('checking_balance', 'savings_balance'):
+        if balance_field in fresh_user:
+            fresh_user[balance_field] = format_monetary_value(fresh_user[balance_field])
     
-    # Get recent transactions
-    transactions = await db.transactions.find({
-        "$or": [
-            {"from_user_id": current_user.id},
-            {"to_user_id": current_user.id}
-        ]
-    }).sort("created_at", -1).limit(10).to_list(10)
-    
-    # Convert ObjectId to string and format monetary values
-    for transaction in transactions:
-        if '_id' in transaction:
-            transaction['_id'] = str(transaction['_id'])
-        transaction['amount'] = format_monetary_value(transaction.get('amount', 0))
+    # Recent transactions come from the write-through cache; only a cold user hits the database
+    projection = field_projection("dashboard.transactions", transaction_fields)
+    with stage("recent_transactions"):
+        recent = await recent_transactions_cache.get(
+            current_user.id,
+            lambda: find_user_transactions(current_user, RECENT_TRANSACTIONS_PROJECTION, RECENT_TRANSACTIONS_SIZE),
+            changed_at=current_user.transactions_changed_at
+        )
+    fields = [field for field, include in projection.items() if include]
+    transactions = [{field: transaction.get(field) for field in fields} for transaction in recent]
     
-    return {
-        "user": fresh_user,
-        "recent_transactions": transactions
-    }
+    # Serialize here rather than in FastAPI so it shows up as its own stage
+    with stage("serialize"):
+        return JSONResponse(jsonable_encoder({
+            "user": fresh_user,
+            "recent_transactions": format_transaction_amounts(transactions)
+        }))
 
 @api_router.post("/transfer")
-async def create_transfer(transfer_data: TransactionCreate, current_user: User = Depends(get_current_user)):
+async def create_transfer(
+    transfer_data: TransactionCreate,
+    current_user: Principal = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    return await run_idempotent(
+        f"transfer:{current_user.id}",
+        idempotency_key,
+        transfer_data,
+        lambda transaction_id: _create_transfer(transfer_data, current_user, transaction_id)
+    )
+
+def validate_transfer_accounts(transfer_data: TransactionCreate):
     # Validate the from_account_type
     if transfer_data.from_account_type not in ["checking", "savings"]:
         raise HTTPException(status_code=400, detail="Invalid account type")
     
-    # Check account balance before creating transaction
-    current_balance = getattr(current_user, f"{transfer_data.from_account_type}_balance")
-    if current_balance < transfer_data.amount:
-        raise HTTPException(status_code=400, detail=f"Insufficient funds in {transfer_data.from_account_type} account")
-    
     # Handle self transfers (between user's own accounts)
     if transfer_data.transaction_type == "self":
         if not transfer_data.to_account_info:
@@ -314,80 +1297,330 @@ async def create_transfer(transfer_data: TransactionCreate, current_user: User =
         
         if transfer_data.from_account_type == transfer_data.to_account_info:
             raise HTTPException(status_code=400, detail="Cannot transfer to the same account")
+
+async def _create_transfer(transfer_data: TransactionCreate, current_user: Principal, transaction_id: str):
+    validate_transfer_accounts(transfer_data)
+    
+    # Check account balance before creating transaction
+    current_balance = getattr(current_user, f"{transfer_data.from_account_type}_balance")
+    if current_balance < transfer_data.amount:
+        raise HTTPException(status_code=400, detail=f"Insufficient funds in {transfer_data.from_account_type} account")
     
     # Create transaction
     transaction = Transaction(
+        id=transaction_id,
         from_user_id=current_user.id,
         from_account_type=transfer_data.from_account_type,
         **transfer_data.dict(exclude={"from_account_type"})
     )
+    now = time.time()
+    transaction.risk_score, transaction.risk_reasons = await risk_engine.score(current_user, transfer_data, now)
     
-    await db.transactions.insert_one(transaction.dict())
+    try:
+        await transaction_batcher.insert(transaction.dict())
+    except (DuplicateKeyError, BulkWriteError) as e:
+        # A retry of an interrupted attempt that had already stored the transfer
+        if not is_duplicate_key_error(e):
+            raise
+        return {"message": "Transfer created successfully. Waiting for admin approval."}
+    await risk_engine.record(current_user.id, transfer_data, now)
+    publish_transaction(transaction.dict())
+    invalidate_analytics_for(transaction.amount)  # pending_outflow
+    auto_approver.notify()
     
     return {"message": "Transfer created successfully. Waiting for admin approval."}
 
-@api_router.get("/transactions")
-async def get_transactions(current_user: User = Depends(get_current_user)):
-    transactions = await db.transactions.find({
-        "$or": [
-            {"from_user_id": current_user.id},
-            {"to_user_id": current_user.id}
-        ]
-    }).sort("created_at", -1).to_list(100)
+@api_router.post("/scheduled-transfers")
+async def create_scheduled_transfer(schedule_data: ScheduledTransferCreate, current_user: Principal = Depends(get_current_user)):
+    """Create a one-time future or recurring (weekly/monthly) transfer"""
+    validate_transfer_accounts(schedule_data)
+    if schedule_data.frequency not in SCHEDULE_FREQUENCIES:
+        raise HTTPException(status_code=400, detail="Invalid frequency")
+    if schedule_data.amount <= 0:
+        raise HTTPException(status_code=400, detail="Amount must be positive")
+    start_at = as_naive_utc(schedule_data.start_at)
+    if start_at <= datetime.utcnow():
+        raise HTTPException(status_code=400, detail="Start date must be in the future")
     
-    # Convert ObjectId to string and format monetary values
-    for transaction in transactions:
-        if '_id' in transaction:
-            transaction['_id'] = str(transaction['_id'])
-        transaction['amount'] = format_monetary_value(transaction.get('amount', 0))
+    schedule = ScheduledTransfer(
+        user_id=current_user.id,
+        day_of_month=start_at.day,
+        next_run_at=start_at,
+        **schedule_data.dict(exclude={"start_at"})
+    )
+    await db.scheduled_transfers.insert_one(schedule.dict())
+    transfer_scheduler.push(schedule.id, schedule.next_run_at)
     
-    return transactions
+    return {"message": "Scheduled transfer created successfully", "id": schedule.id}
+
+@api_router.get("/scheduled-transfers")
+async def get_scheduled_transfers(current_user: Principal = Depends(get_current_user)):
+    schedules = await db.scheduled_transfers.find(
+        {"user_id": current_user.id, "active": True}, {"_id": 0}
+    ).sort("next_run_at", 1).to_list(100)
+    for schedule in schedules:
+        schedule['amount'] = format_monetary_value(schedule['amount'])
+    return schedules
+
+@api_router.delete("/scheduled-transfers/{schedule_id}")
+async def cancel_scheduled_transfer(schedule_id: str, current_user: Principal = Depends(get_current_user)):
+    result = await db.scheduled_transfers.update_one(
+        {"id": schedule_id, "user_id": current_user.id, "active": True},
+        {"$set": {"active": False}}
+    )
+    if result.modified_count == 0:
+        raise HTTPException(status_code=404, detail="Scheduled transfer not found")
+    transfer_scheduler.discard(schedule_id)
+    return {"message": "Scheduled transfer cancelled"}
+
+@api_router.get("/events/stream")
+async def stream_events(request: Request, current_user: Principal = Depends(get_current_user)):
+    """Server-sent events with the caller's new or updated transactions and balance deltas.
+    
+    Load /dashboard on the "ready" event, which is sent once the stream is
+    subscribed, then apply these; a "resync" event means events were dropped and
+    the dashboard should be loaded again.
+    """
+    queue = event_hub.subscribe(current_user.id)
+    
+    async def events():
+        try:
+            yield "event: ready\ndata: {}\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), settings.live_events_heartbeat_seconds)
+                except asyncio.TimeoutError:
+                    # Keeps proxies from closing an idle stream
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(jsonable_encoder(event))}\n\n"
+        finally:
+            event_hub.unsubscribe(current_user.id, queue)
+    
+    return StreamingResponse(
+        events(), media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@api_router.get("/transactions")
+async def get_transactions(current_user: Principal = Depends(get_current_user), fields: Optional[str] = None):
+    transactions = await find_user_transactions(current_user, field_projection("transactions", fields), 100)
+    
+    return format_transaction_amounts(transactions)
 
 # Admin routes
 @api_router.get("/admin/pending-users")
-async def get_pending_users(admin_user: User = Depends(get_admin_user)):
-    users = await db.users.find({"is_approved": False}).to_list(100)
-    # Convert ObjectId to string
-    for user in users:
-        if '_id' in user:
-            user['_id'] = str(user['_id'])
-    return users
+async def get_pending_users(admin_user: Principal = Depends(get_admin_user), fields: Optional[str] = None):
+    return await reporting_db.users.find(
+        {"is_approved": False}, field_projection("admin.pending-users", fields)
+    ).to_list(100)
 
 @api_router.get("/admin/pending-transactions")
-async def get_pending_transactions(admin_user: User = Depends(get_admin_user)):
-    transactions = await db.transactions.find({"status": "pending"}).to_list(100)
-    # Convert ObjectId to string and format monetary values
-    for transaction in transactions:
-        if '_id' in transaction:
-            transaction['_id'] = str(transaction['_id'])
+async def get_pending_transactions(
+    admin_user: Principal = Depends(get_admin_user),
+    fields: Optional[str] = None,
+    order: str = "oldest"
+):
+    if order not in PENDING_QUEUE_SORT:
+        raise HTTPException(status_code=400, detail="Invalid order")
+    # A fixed order so every admin sees the queue the same way
+    transactions = await db.transactions.find(
+        {"status": "pending"}, field_projection("admin.pending-transactions", fields)
+    ).sort(PENDING_QUEUE_SORT[order]).to_list(100)
+    return format_transaction_amounts(transactions)
+
+@api_router.post("/admin/pending-transactions/claim")
+async def claim_pending_transactions(claim: ClaimRequest, admin_user: Principal = Depends(get_admin_user)):
+    """Atomically lease the next pending transactions to the calling admin"""
+    if claim.order not in PENDING_QUEUE_SORT:
+        raise HTTPException(status_code=400, detail="Invalid order")
+    
+    now = datetime.utcnow()
+    lease_expires_at = now + timedelta(seconds=claim.lease_seconds)
+    claimed = []
+    # Each find_one_and_update is atomic, so two admins can never lease the same row
+    for _ in range(claim.limit):
+        transaction = await db.transactions.find_one_and_update(
+            lease_available_filter(now),
+            {"$set": {"lease_owner": admin_user.id, "lease_expires_at": lease_expires_at}},
+            sort=PENDING_QUEUE_SORT[claim.order],
+            return_document=ReturnDocument.AFTER
+        )
+        if transaction is None:
+            break
+        transaction['_id'] = str(transaction['_id'])
         transaction['amount'] = format_monetary_value(transaction.get('amount', 0))
-    return transactions
+        claimed.append(transaction)
+    
+    return {"lease_expires_at": lease_expires_at.isoformat(), "transactions": claimed}
+
+@api_router.post("/admin/pending-transactions/release")
+async def release_pending_transactions(transaction_ids: List[str], admin_user: Principal = Depends(get_admin_user)):
+    """Hand leased transactions back to the queue without processing them"""
+    result = await db.transactions.update_many(
+        {"id": {"$in": transaction_ids}, "status": "pending", "lease_owner": admin_user.id},
+        {"$set": {"lease_owner": None, "lease_expires_at": None}}
+    )
+    return {"released": result.modified_count}
+
+@api_router.post("/admin/pending-transactions/priority")
+async def set_transaction_priority(
+    transaction_id: str,
+    priority: int = Query(..., ge=0, le=100),
+    admin_user: Principal = Depends(get_admin_user)
+):
+    """Move a pending transaction up (or back down) the priority order of the queue"""
+    result = await db.transactions.update_one(
+        {"id": transaction_id, "status": "pending"},
+        {"$set": {"priority": priority}}
+    )
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Pending transaction not found")
+    await audit_log.record(admin_user, "set_transaction_priority", transaction_id=transaction_id, priority=priority)
+    return {"message": "Priority updated", "priority": priority}
+
+@api_router.get("/admin/lock-stats")
+async def get_lock_stats(admin_user: Principal = Depends(get_admin_user)):
+    """Contention on the per-account balance locks since startup"""
+    return account_locks.stats()
+
+@api_router.get("/admin/auto-approval")
+async def get_auto_approval_stats(admin_user: Principal = Depends(get_admin_user)):
+    """Active rules, per-rule hit counters and settlement latency of auto-approved transfers"""
+    return auto_approver.stats()
+
+@api_router.get("/admin/analytics")
+async def get_bank_analytics(admin_user: Principal = Depends(get_admin_user)):
+    """Bank-wide totals, recomputed at most once per TTL or after a large write"""
+    return await analytics_cache.get_or_compute(compute_bank_analytics, settings.analytics_ttl_seconds)
+
+@api_router.get("/admin/transactions/query")
+async def query_transactions(
+    transaction_type: Optional[str] = None,
+    status_filter: Optional[str] = Query(None, alias="status"),
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    user_id: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    explain: bool = False,
+    admin_user: Principal = Depends(get_admin_user)
+):
+    """Filter transactions for operations, newest first, with keyset pagination.
+    
+    Ranges reaching past the archive cutoff also cover transactions_archive.
+    """
+    clauses = []
+    if transaction_type:
+        clauses.append({"transaction_type": transaction_type})
+    if status_filter:
+        clauses.append({"status": status_filter})
+    
+    amount_range = {}
+    if min_amount is not None:
+        amount_range["$gte"] = min_amount
+    if max_amount is not None:
+        amount_range["$lte"] = max_amount
+    if amount_range:
+        clauses.append({"amount": amount_range})
+    
+    created_range = {}
+    if start is not None:
+        created_range["$gte"] = as_naive_utc(start)
+    if end is not None:
+        created_range["$lt"] = as_naive_utc(end)
+    if created_range:
+        clauses.append({"created_at": created_range})
+    
+    if cursor:
+        cursor_created_at, cursor_id = decode_cursor(cursor)
+        clauses.append({"$or": [
+            {"created_at": {"$lt": cursor_created_at}},
+            {"created_at": cursor_created_at, "id": {"$lt": cursor_id}}
+        ]})
+    
+    query = {"$and": clauses} if clauses else {}
+    if user_id:
+        # A rooted $or lets each branch be planned against its own user index
+        query = {"$or": [
+            {"$and": [{"from_user_id": user_id}] + clauses},
+            {"$and": [{"to_user_id": user_id}] + clauses}
+        ]}
+    find = reporting_db.transactions.find(query, field_projection("admin.pending-transactions", None))
+    find = find.sort([("created_at", -1), ("id", -1)]).limit(limit)
+    index_name = transaction_query_index(user_id, transaction_type, status_filter)
+    if index_name:
+        find = find.hint(index_name)
+    
+    if explain:
+        plan = await find.explain()
+        return {"index": index_name, "winning_plan": plan["queryPlanner"]["winningPlan"]}
+    
+    transactions = await find.to_list(limit)
+    
+    # Archived rows are settled and older than the cutoff, so the archive is only
+    # read when the range reaches that far back and the hot page didn't fill first
+    archive_cutoff = datetime.utcnow() - timedelta(days=settings.archive_after_days)
+    if (
+        (status_filter is None or status_filter in SETTLED_STATUSES)
+        and (start is None or as_naive_utc(start) < archive_cutoff)
+        and (len(transactions) < limit or transactions[-1]["created_at"] < archive_cutoff)
+    ):
+        projection = field_projection("admin.pending-transactions", None)
+        archive_projection = {ARCHIVE_FIELDS[field]: 1 for field in projection if field in ARCHIVE_FIELDS}
+        archived = reporting_db.transactions_archive.find(archive_filter(query), archive_projection)
+        archived = archived.sort([("c", -1), ("_id", -1)]).limit(limit)
+        if not user_id:
+            archived = archived.hint("archive_created")
+        
+        # Merged in keyset order, so cursors work across both; skip rows caught mid-move
+        seen = {transaction["id"] for transaction in transactions}
+        transactions += [
+            expand_transaction(row, projection)
+            for row in await archived.to_list(limit) if row["_id"] not in seen
+        ]
+        transactions.sort(key=lambda transaction: (transaction["created_at"], transaction["id"]), reverse=True)
+        transactions = transactions[:limit]
+    
+    next_cursor = encode_cursor(transactions[-1]) if len(transactions) == limit else None
+    return {
+        "transactions": format_transaction_amounts(transactions),
+        "next_cursor": next_cursor
+    }
 
 @api_router.post("/admin/approve-user")
-async def approve_user(action: AdminAction, admin_user: User = Depends(get_admin_user)):
+async def approve_user(action: AdminAction, admin_user: Principal = Depends(get_admin_user)):
     if action.action == "approve":
         await db.users.update_one(
             {"id": action.user_id},
             {"$set": {"is_approved": True}}
         )
+        await audit_log.record(admin_user, "approve_user", target_user_id=action.user_id)
         return {"message": "User approved successfully"}
     elif action.action == "decline":
         await db.users.delete_one({"id": action.user_id})
+        await audit_log.record(admin_user, "decline_user", target_user_id=action.user_id)
         return {"message": "User declined and removed"}
     else:
         raise HTTPException(status_code=400, detail="Invalid action")
 
-@api_router.post("/admin/process-transaction")
-async def process_transaction(transaction_id: str, action: str, admin_user: User = Depends(get_admin_user)):
-    transaction = await db.transactions.find_one({"id": transaction_id})
-    if not transaction:
-        raise HTTPException(status_code=404, detail="Transaction not found")
+async def approve_pending_transaction(transaction: dict, completed_filter: dict, actor, recheck=None) -> datetime:
+    """Approve a pending transaction and move its money; shared by admins and the auto-approver.
     
-    if action == "approve":
+    recheck, if given, is awaited with the sender's document under the account
+    locks and raises HTTPException to stop the approval.
+    """
+    # Serialize with other mutations of the same accounts from the balance check on
+    credited_user_id = transaction["to_user_id"] if transaction["transaction_type"] == "internal" else None
+    async with account_locks.hold(transaction["from_user_id"], credited_user_id):
         # Get sender user
         from_user = await db.users.find_one({"id": transaction["from_user_id"]})
         if not from_user:
             raise HTTPException(status_code=404, detail="Sender user not found")
+        if recheck is not None:
+            await recheck(from_user)
         
         # Determine which account to check balance from
         from_account_field = f"{transaction.get('from_account_type', 'checking')}_balance"
@@ -402,6 +1635,16 @@ async def process_transaction(transaction_id: str, action: str, admin_user: User
         if from_balance < amount:
             raise HTTPException(status_code=400, detail=f"Insufficient funds in {transaction.get('from_account_type', 'checking')} account")
         
+        # Settle the transaction first; this also drops it from the pending queue index
+        approved_at = datetime.utcnow()
+        result = await db.transactions.update_one(
+            completed_filter,
+            {"$set": {"status": "approved", "approved_at": approved_at,
+                      "lease_owner": None, "lease_expires_at": None, "outbox_pending": approved_at}}
+        )
+        if result.modified_count == 0:
+            raise HTTPException(status_code=409, detail="Transaction already processed")
+        
         # Deduct from sender's specified account
         await db.users.update_one(
             {"id": transaction["from_user_id"]},
@@ -424,56 +1667,106 @@ async def process_transaction(transaction_id: str, action: str, admin_user: User
                 {"id": transaction["from_user_id"]},
                 {"$inc": {to_account_field: amount}}
             )
-        
-        # For domestic and international transfers, money goes out of the system
-        # so we only deduct from sender (already done above)
-        
-        # Update transaction status
-        await db.transactions.update_one(
-            {"id": transaction_id},
-            {"$set": {"status": "approved", "approved_at": datetime.utcnow()}}
-        )
-        
+    
+    # For domestic and international transfers, money goes out of the system
+    # so we only deduct from sender (already done above)
+    
+    approved = {**transaction, "status": "approved", "approved_at": approved_at,
+                "lease_owner": None, "lease_expires_at": None}
+    await record_approval_event(approved)
+    publish_transaction(approved)
+    invalidate_analytics_for(amount)
+    await audit_log.record(
+        actor, "approve_transaction",
+        transaction_id=transaction["id"], target_user_id=transaction["from_user_id"], amount=amount
+    )
+    return approved_at
+
+@api_router.post("/admin/process-transaction")
+async def process_transaction(transaction_id: str, action: str, admin_user: Principal = Depends(get_admin_user)):
+    transaction = await db.transactions.find_one({"id": transaction_id})
+    if not transaction:
+        raise HTTPException(status_code=404, detail="Transaction not found")
+    
+    if transaction.get("status") != "pending":
+        raise HTTPException(status_code=409, detail="Transaction already processed")
+    
+    # Respect another admin's unexpired lease
+    lease_owner = transaction.get("lease_owner")
+    lease_expires_at = transaction.get("lease_expires_at")
+    if lease_owner and lease_owner != admin_user.id and lease_expires_at and lease_expires_at > datetime.utcnow():
+        raise HTTPException(status_code=409, detail="Transaction is claimed by another admin")
+    
+    # Only one admin can move the transaction out of pending
+    completed_filter = {"id": transaction_id, "status": "pending", "lease_owner": lease_owner}
+    
+    if action == "approve":
+        await approve_pending_transaction(transaction, completed_filter, admin_user)
         return {"message": "Transaction approved successfully"}
     
     elif action == "decline":
-        await db.transactions.update_one(
-            {"id": transaction_id},
-            {"$set": {"status": "declined", "approved_at": datetime.utcnow()}}
+        declined_at = datetime.utcnow()
+        result = await db.transactions.update_one(
+            completed_filter,
+            {"$set": {"status": "declined", "approved_at": declined_at,
+                      "lease_owner": None, "lease_expires_at": None}}
+        )
+        if result.modified_count == 0:
+            raise HTTPException(status_code=409, detail="Transaction already processed")
+        publish_transaction({**transaction, "status": "declined", "approved_at": declined_at,
+                             "lease_owner": None, "lease_expires_at": None})
+        invalidate_analytics_for(transaction["amount"])  # pending_outflow
+        await audit_log.record(
+            admin_user, "decline_transaction",
+            transaction_id=transaction_id, target_user_id=transaction["from_user_id"]
         )
         return {"message": "Transaction declined"}
     
     else:
         raise HTTPException(status_code=400, detail="Invalid action")
 
+# Manual credits and debits remember the ids they applied, newest last, so a
+# retried attempt never moves the balance twice; retries come within minutes
+APPLIED_TRANSACTION_IDS_KEPT = 20
+
 @api_router.post("/admin/manual-transaction")
-async def manual_transaction(action: AdminAction, admin_user: User = Depends(get_admin_user)):
+async def manual_transaction(
+    action: AdminAction,
+    admin_user: Principal = Depends(get_admin_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    return await run_idempotent(
+        f"manual-transaction:{admin_user.id}",
+        idempotency_key,
+        action,
+        lambda transaction_id: _manual_transaction(action, admin_user, transaction_id)
+    )
+
+async def _manual_transaction(action: AdminAction, admin_user: Principal, transaction_id: str):
+    if action.action not in ("credit", "debit"):
+        raise HTTPException(status_code=400, detail="Invalid action")
+    
     # Parse custom date if provided, otherwise use current time
     transaction_date = datetime.utcnow()
     if action.custom_date:
         try:
             # Parse ISO datetime string
-            transaction_date = datetime.fromisoformat(action.custom_date.replace('Z', '+00:00'))
+            transaction_date = as_naive_utc(datetime.fromisoformat(action.custom_date.replace('Z', '+00:00')))
         except (ValueError, AttributeError):
             # If parsing fails, use current time as fallback
             transaction_date = datetime.utcnow()
     
-    # Format amount to ensure 2 decimal places for display
-    formatted_amount = format_monetary_value(action.amount)
     # Use float for database operations
     amount = float(action.amount)
+    field = f"{action.account_type}_balance"
     
+    # Create transaction record with custom date
     if action.action == "credit":
-        field = f"{action.account_type}_balance"
-        await db.users.update_one(
-            {"id": action.user_id},
-            {"$inc": {field: amount}}
-        )
-        
-        # Create transaction record with custom date
         transaction = Transaction(
+            id=transaction_id,
             from_user_id="system",
             to_user_id=action.user_id,
+            to_account_info=action.account_type,
             amount=amount,
             transaction_type="credit",
             description=action.description or "Manual credit",
@@ -481,20 +1774,11 @@ async def manual_transaction(action: AdminAction, admin_user: User = Depends(get
             created_at=transaction_date,
             approved_at=transaction_date
         )
-        await db.transactions.insert_one(transaction.dict())
-        
-        return {"message": "Credit added successfully"}
-    
-    elif action.action == "debit":
-        field = f"{action.account_type}_balance"
-        await db.users.update_one(
-            {"id": action.user_id},
-            {"$inc": {field: -amount}}
-        )
-        
-        # Create transaction record with custom date
+    else:
         transaction = Transaction(
+            id=transaction_id,
             from_user_id=action.user_id,
+            from_account_type=action.account_type or "checking",
             to_user_id="system",
             amount=amount,
             transaction_type="debit",
@@ -503,21 +1787,37 @@ async def manual_transaction(action: AdminAction, admin_user: User = Depends(get
             created_at=transaction_date,
             approved_at=transaction_date
         )
-        await db.transactions.insert_one(transaction.dict())
-        
-        return {"message": "Debit processed successfully"}
     
-    else:
-        raise HTTPException(status_code=400, detail="Invalid action")
+    # The ledger entry goes first and the balance change is keyed by its id, so a
+    # retry taking over an interrupted attempt completes it instead of repeating it
+    try:
+        await db.transactions.insert_one({**transaction.dict(), "outbox_pending": datetime.utcnow()})
+    except DuplicateKeyError:
+        pass
+    async with account_locks.hold(action.user_id):
+        await db.users.update_one(
+            {"id": action.user_id, "applied_transaction_ids": {"$ne": transaction_id}},
+            {"$inc": {field: amount if action.action == "credit" else -amount},
+             "$push": {"applied_transaction_ids": {"$each": [transaction_id], "$slice": -APPLIED_TRANSACTION_IDS_KEPT}}}
+        )
+    
+    await record_approval_event(transaction.dict())
+    publish_transaction(transaction.dict())
+    invalidate_analytics_for(amount)
+    await audit_log.record(
+        admin_user, f"manual_{action.action}",
+        transaction_id=transaction.id, target_user_id=action.user_id,
+        amount=amount, account_type=action.account_type
+    )
+    
+    if action.action == "credit":
+        return {"message": "Credit added successfully"}
+    return {"message": "Debit processed successfully"}
 
 @api_router.get("/admin/users")
-async def get_all_users(admin_user: User = Depends(get_admin_user)):
-    users = await db.users.find().to_list(1000)
-    # Convert ObjectId to string and add login status
+async def get_all_users(admin_user: Principal = Depends(get_admin_user), fields: Optional[str] = None):
+    users = await reporting_db.users.find({}, field_projection("admin.users", fields)).to_list(1000)
     for user in users:
-        if '_id' in user:
-            user['_id'] = str(user['_id'])
-        
         # Add real-time login status
         user_id = user.get('id')
         if user_id in active_sessions:
@@ -537,8 +1837,55 @@ async def get_all_users(admin_user: User = Depends(get_admin_user)):
     
     return users
 
+@api_router.get("/admin/users/search")
+async def search_users(
+    q: str = Query(..., min_length=SEARCH_MIN_KEY_LENGTH),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(20, ge=1, le=100),
+    admin_user: Principal = Depends(get_admin_user)
+):
+    """Prefix and substring search over email, full name and phone"""
+    words = normalize_search_query(q)
+    if not words or max(len(word) for word in words) < SEARCH_MIN_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail="Search query too short")
+    
+    start = (page - 1) * page_size
+    if start >= SEARCH_MAX_RESULTS:
+        raise HTTPException(status_code=400, detail=f"Only the first {SEARCH_MAX_RESULTS} matches can be paged; refine the search")
+    
+    # Count every tier (capped, which keeps any page below the cap exact), then
+    # read just the slice of each tier that falls on this page
+    tiers = customer_search_tiers(words)
+    counts = await asyncio.gather(*(
+        reporting_db.users.count_documents(tier, limit=SEARCH_MAX_RESULTS) for tier in tiers
+    ))
+    projection = field_projection("admin.users", None)
+    projection.update({"phone": 1})
+    
+    results = []
+    skip = start
+    for tier, count in zip(tiers, counts):
+        if skip >= count:
+            skip -= count
+            continue
+        limit = page_size - len(results)
+        results += await reporting_db.users.find(tier, projection).sort(
+            [("search_name", 1), ("id", 1)]
+        ).skip(skip).limit(limit).to_list(limit)
+        skip = 0
+        if len(results) == page_size:
+            break
+    
+    return {
+        "total": min(sum(counts), SEARCH_MAX_RESULTS),
+        "total_capped": sum(counts) >= SEARCH_MAX_RESULTS,
+        "page": page,
+        "page_size": page_size,
+        "results": results
+    }
+
 @api_router.post("/admin/logout-user")
-async def logout_user(action: AdminAction, admin_user: User = Depends(get_admin_user)):
+async def logout_user(action: AdminAction, admin_user: Principal = Depends(get_admin_user)):
     """Immediately logout a specific user by terminating their session"""
     try:
         user_id = action.user_id
@@ -558,13 +1905,14 @@ async def logout_user(action: AdminAction, admin_user: User = Depends(get_admin_
             {"id": user_id},
             {"$set": {"force_logout_at": datetime.utcnow()}}
         )
+        await audit_log.record(admin_user, "logout_user", target_user_id=user_id)
         
         return {"message": "User logged out successfully", "user_id": user_id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to logout user: {str(e)}")
 
 @api_router.post("/admin/force-logout")
-async def force_logout_user(action: AdminAction, admin_user: User = Depends(get_admin_user)):
+async def force_logout_user(action: AdminAction, admin_user: Principal = Depends(get_admin_user)):
     """Force logout a user by blacklisting their current active tokens"""
     try:
         # Find all active sessions for the user (in a real app, you'd track sessions in DB)
@@ -579,10 +1927,13 @@ async def force_logout_user(action: AdminAction, admin_user: User = Depends(get_
         raise HTTPException(status_code=500, detail=f"Failed to logout user: {str(e)}")
 
 @api_router.get("/admin/active-sessions")
-async def get_active_sessions(admin_user: User = Depends(get_admin_user)):
+async def get_active_sessions(admin_user: Principal = Depends(get_admin_user)):
     """Get list of users with active sessions (approximation)"""
     # In a real app, you'd track actual sessions. For demo, we'll show recent login activity
-    users = await db.users.find({"role": "customer", "is_approved": True}).to_list(1000)
+    users = await reporting_db.users.find(
+        {"role": "customer", "is_approved": True},
+        {"_id": 0, "id": 1, "full_name": 1, "email": 1, "created_at": 1, "force_logout_at": 1}
+    ).to_list(1000)
     
     active_users = []
     for user in users:
@@ -598,7 +1949,7 @@ async def get_active_sessions(admin_user: User = Depends(get_admin_user)):
     return active_users
 
 @api_router.get("/admin/pending-login-approvals")
-async def get_pending_login_approvals(admin_user: User = Depends(get_admin_user)):
+async def get_pending_login_approvals(admin_user: Principal = Depends(get_admin_user)):
     """Get all pending login approval requests"""
     approvals_with_ids = []
     for approval_id, approval_data in pending_login_approvals.items():
@@ -608,7 +1959,7 @@ async def get_pending_login_approvals(admin_user: User = Depends(get_admin_user)
     return approvals_with_ids
 
 @api_router.post("/admin/approve-login")
-async def approve_login_request(approval_data: dict, admin_user: User = Depends(get_admin_user)):
+async def approve_login_request(approval_data: dict, admin_user: Principal = Depends(get_admin_user)):
     """Approve or deny a login request"""
     approval_id = approval_data.get("approval_id")
     action = approval_data.get("action")  # "approve", "deny", or "get-approved-token"
@@ -657,6 +2008,8 @@ async def approve_login_request(approval_data: dict, admin_user: User = Depends(
             "checking_balance": user["checking_balance"],
             "savings_balance": user["savings_balance"]
         }
+        notify_approval_decision(approval_id)
+        await audit_log.record(admin_user, "approve_login", approval_id=approval_id, target_user_id=user["id"])
         
         return {
             "message": "Login approved successfully",
@@ -667,25 +2020,30 @@ async def approve_login_request(approval_data: dict, admin_user: User = Depends(
         # Update approval status
         approval_request["status"] = "denied"
         approval_request["denied_at"] = datetime.utcnow()
+        notify_approval_decision(approval_id)
+        await audit_log.record(admin_user, "deny_login", approval_id=approval_id, target_user_id=approval_request["user_id"])
         
         return {"message": "Login request denied"}
     else:
         raise HTTPException(status_code=400, detail="Invalid action")
 
 @api_router.get("/check-approval-status/{approval_id}")
-async def check_approval_status(approval_id: str):
-    """Check the status of a login approval request"""
+async def check_approval_status(approval_id: str, wait: float = Query(0, ge=0, le=30)):
+    """Check the status of a login approval request, optionally long-polling up to `wait` seconds"""
     if approval_id not in pending_login_approvals:
         raise HTTPException(status_code=404, detail="Approval request not found")
     
     approval = pending_login_approvals[approval_id]
+    if wait and approval["status"] == "pending":
+        await wait_for_approval_decision(approval_id, wait)
+    
     return {
         "status": approval["status"],
         "approval_id": approval_id
     }
 
-@api_router.get("/check-force-logout")
-async def check_force_logout(current_user: User = Depends(get_current_user)):
+@api_router.get("/check-force-logout", dependencies=[Depends(poll_rate_limit)])
+async def check_force_logout(current_user: Principal = Depends(get_current_user)):
     """Check if user should be force logged out"""
     user_id = current_user.id
     if user_id in force_logout_events:
@@ -701,16 +2059,66 @@ async def check_force_logout(current_user: User = Depends(get_current_user)):
     
     return {"force_logout": False}
 
-# Include the router in the main app
-app.include_router(api_router)
+# Admin-armed profiling: the next N requests under a path prefix get profiled, one at a time for cProfile
+profiling_requests = {"path_prefix": None, "remaining": 0, "mode": "cprofile"}
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=["*"],
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+class ProfilingRequest(BaseModel):
+    path_prefix: str = "/api/"
+    requests: int = Field(default=1, ge=0, le=100)
+    mode: str = "cprofile"  # "cprofile" or "sample"
+
+@api_router.post("/admin/profiling")
+async def arm_profiling(profiling: ProfilingRequest, admin_user: Principal = Depends(get_admin_user)):
+    """Profile the next requests under a path prefix; requests=0 disarms"""
+    if profiling.mode not in RequestProfiler.MODES:
+        raise HTTPException(status_code=400, detail="Invalid mode")
+    profiling_requests.update(path_prefix=profiling.path_prefix, remaining=profiling.requests, mode=profiling.mode)
+    return {**profiling_requests, "output_dir": settings.profile_dir}
+
+def profiling_mode_for(request: Request) -> Optional[str]:
+    # Per-request opt in, guarded by a shared token
+    mode = request.headers.get("x-profile")
+    token = request.headers.get("x-profile-token")
+    if mode and settings.profile_token and token and secrets.compare_digest(token, settings.profile_token):
+        mode = mode if mode in RequestProfiler.MODES else "cprofile"
+        # Another request already holds the cProfile hook; this one runs unprofiled
+        return mode if RequestProfiler.available(mode) else None
+    
+    # Armed requests stay armed until a matching request can actually be profiled
+    if (profiling_requests["remaining"] > 0 and request.url.path.startswith(profiling_requests["path_prefix"])
+            and RequestProfiler.available(profiling_requests["mode"])):
+        profiling_requests["remaining"] -= 1
+        return profiling_requests["mode"]
+    return None
+
+async def timing_middleware(request: Request, call_next):
+    """Collect per-stage timings; emit them as Server-Timing and log slow or sampled requests"""
+    timings = RequestTimings()
+    token = current_timings.set(timings)
+    try:
+        mode = profiling_mode_for(request)
+        if mode:
+            label = request.url.path.strip("/").replace("/", "_") or "root"
+            with RequestProfiler(mode, settings.profile_dir, label) as profiler:
+                response = await call_next(request)
+            response.headers["X-Profile-Output"] = str(profiler.path)
+        else:
+            response = await call_next(request)
+    finally:
+        current_timings.reset(token)
+    
+    response.headers["Server-Timing"] = timings.server_timing_header()
+    total_ms = timings.total_ms()
+    if total_ms >= settings.slow_request_ms or random.random() < settings.timing_log_sample_rate:
+        timing_logger.info(json.dumps({
+            "method": request.method,
+            "path": request.url.path,
+            "status": response.status_code,
+            "total_ms": round(total_ms, 2),
+            "slow": total_ms >= settings.slow_request_ms,
+            "stages": {name: round(duration, 2) for name, duration in timings.stages.items()}
+        }))
+    return response
 
 # Configure logging
 logging.basicConfig(
@@ -718,13 +2126,79 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
+timing_logger = logging.getLogger(f"{__name__}.timing")
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
+# Indexes backing the pending transaction queue
+async def create_queue_indexes():
+    # Partial indexes only hold pending rows, so settled transactions leave the queue index
+    await db.transactions.create_index(
+        [("status", 1), ("created_at", 1)],
+        name="pending_queue_oldest",
+        partialFilterExpression={"status": "pending"}
+    )
+    await db.transactions.create_index(
+        [("status", 1), ("priority", -1), ("created_at", 1)],
+        name="pending_queue_priority",
+        partialFilterExpression={"status": "pending"}
+    )
+    await db.transactions.create_index(
+        [("status", 1), ("risk_score", -1), ("created_at", 1)],
+        name="pending_queue_risk",
+        partialFilterExpression={"status": "pending"}
+    )
+
+# Idempotency records expire on their own via a TTL index
+async def create_idempotency_indexes():
+    await db.idempotency_keys.create_index([("scope", 1), ("key", 1)], unique=True)
+    await db.idempotency_keys.create_index("expires_at", expireAfterSeconds=0)
+
+# Audit log lookups by admin or target, newest first
+async def create_audit_indexes():
+    await db.audit_log.create_index("id", unique=True)
+    await db.audit_log.create_index([("admin_id", 1), ("timestamp", -1)])
+    await db.audit_log.create_index([("target_user_id", 1), ("timestamp", -1)])
+
+# Scheduled transfers are found by due time; unique transaction ids stop a run firing twice
+async def create_scheduler_indexes():
+    await db.scheduled_transfers.create_index("id", unique=True)
+    await db.scheduled_transfers.create_index([("active", 1), ("next_run_at", 1)])
+    await db.scheduled_transfers.create_index([("user_id", 1), ("next_run_at", 1)])
+    await db.transactions.create_index("id", unique=True, name="transaction_id_unique")
+
+# Outbox events are read in seq order and expire once well past delivery; the
+# partial index finds the few transactions still owed an approval event
+async def create_outbox_indexes():
+    await db.outbox.create_index("id", unique=True)
+    await db.outbox.create_index("seq", unique=True)
+    await db.outbox.create_index("created_at", expireAfterSeconds=settings.outbox_retention_days * 86400)
+    await db.transactions.create_index(
+        "outbox_pending", name="outbox_pending", partialFilterExpression={"outbox_pending": {"$exists": True}}
+    )
+
+# History lookups against archived transactions
+async def create_archive_indexes():
+    for keys, name in ARCHIVE_INDEXES:
+        await db.transactions_archive.create_index(keys, name=name)
+
+# Compound indexes for the ops transaction query
+async def create_query_indexes():
+    for name, keys in TRANSACTION_QUERY_INDEXES.items():
+        await db.transactions.create_index(keys, name=name)
 
-# Create admin user on startup
-@app.on_event("startup")
+# Customer search indexes; backfill_search_fields.py fills in users created before them
+async def create_search_index():
+    await db.users.create_index("search_keys", name="customer_search")
+    await db.users.create_index("search_tokens", name="customer_search_tokens")
+    await db.users.create_index([("search_fields", 1), ("search_name", 1), ("id", 1)], name="customer_search_fields_by_name")
+    await db.users.create_index([("search_name", 1), ("id", 1)], name="customer_search_by_name")
+    await db.users.create_index("search_version", name="customer_search_version")
+
+async def warm_connection_pool(count: int):
+    """Open `count` pooled connections up front; concurrent pings each need their own socket"""
+    if count > 0:
+        await asyncio.gather(*(client.admin.command("ping") for _ in range(count)))
+
+# Create the default admin user
 async def create_admin_user():
     admin_exists = await db.users.find_one({"role": "admin"})
     if not admin_exists:
@@ -741,6 +2215,86 @@ async def create_admin_user():
             savings_balance=0.0
         )
         admin_user_dict = admin_user.dict()
-        admin_user_dict["hashed_password"] = get_password_hash("admin123")
+        admin_user_dict["hashed_password"] = await run_in_threadpool(get_password_hash, "admin123")
+        admin_user_dict.update(customer_search_document(admin_user_dict))
         await db.users.insert_one(admin_user_dict)
-        logger.info("Admin user created: admin@bank.com / admin123")
\ No newline at end of file
+        logger.info("Admin user created: admin@bank.com / admin123")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global settings, client, db, reporting_db
+    settings = app.state.settings
+    client = AsyncIOMotorClient(settings.mongo_url, **settings.mongo_client_options())
+    db = client[settings.db_name]
+    reporting_db = client.get_database(settings.db_name, read_preference=settings.reporting_read_preference_mode())
+    transaction_batcher.max_batch = settings.transaction_batch_max_size
+    transaction_batcher.window = settings.transaction_batch_window_ms / 1000
+    audit_log.queue_size = settings.audit_queue_size
+    audit_log.batch_size = settings.audit_batch_size
+    audit_log.flush_interval = settings.audit_flush_interval_ms / 1000
+    audit_log.enqueue_timeout = settings.audit_enqueue_timeout_ms / 1000
+    pwd_context.load(settings.password_context_config())
+    # Fail at startup rather than on the first login if a scheme's library is missing
+    for scheme in pwd_context.schemes():
+        pwd_context.handler(scheme).get_backend()
+    
+    await warm_connection_pool(settings.mongo_warm_connections)
+    await create_queue_indexes()
+    await create_idempotency_indexes()
+    await create_search_index()
+    await create_query_indexes()
+    await create_audit_indexes()
+    await db.risk_counters.create_index("user_id", unique=True)
+    await create_scheduler_indexes()
+    await create_archive_indexes()
+    await create_outbox_indexes()
+    if settings.bootstrap_admin:
+        await create_admin_user()
+    audit_log.start()
+    risk_engine.start(settings.risk_persist_interval_seconds)
+    transfer_scheduler.horizon = timedelta(seconds=settings.scheduler_horizon_seconds)
+    transfer_scheduler.batch_size = settings.scheduler_batch_size
+    transfer_scheduler.start()
+    outbox_relay.batch_size = settings.outbox_batch_size
+    outbox_relay.poll_interval = settings.outbox_poll_interval_ms / 1000
+    outbox_relay.gap_timeout = settings.outbox_gap_timeout_seconds
+    if settings.outbox_sink_path:
+        outbox_relay.start(NDJSONFileSink(settings.outbox_sink_path))
+    event_hub.queue_size = settings.live_events_queue_size
+    recent_transactions_cache.max_users = settings.recent_transactions_cache_users
+    recent_transactions_cache.ttl = settings.recent_transactions_cache_ttl()
+    if settings.live_events_source == "change_stream":
+        transaction_change_source.start()
+    auto_approver.workers = settings.auto_approval_workers
+    auto_approver.poll_interval = settings.auto_approval_poll_interval_ms / 1000
+    auto_approver.start(settings.auto_approval_rules)
+    
+    yield
+    
+    await transfer_scheduler.stop()
+    await auto_approver.stop()
+    await transaction_change_source.stop()
+    await outbox_relay.stop()
+    await audit_log.stop()
+    await risk_engine.stop()
+    # Write out any transfers still waiting in the batch window
+    while transaction_batcher.pending:
+        await transaction_batcher.flush()
+    client.close()
+
+def create_app(settings: Optional[Settings] = None) -> FastAPI:
+    """Build the app; the database client is only created when the app starts"""
+    app = FastAPI(lifespan=lifespan)
+    app.state.settings = settings or Settings.from_env()
+    app.include_router(api_router)
+    app.middleware("http")(timing_middleware)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_credentials=True,
+        allow_origins=["*"],
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    return app
+
+app = create_app()
@@ -0,0 +1,150 @@
+"""Typed application settings, read from the environment and backend/.env"""
+import os
+from pathlib import Path
+from typing import List, Literal, Mapping, Optional
+
+from dotenv import load_dotenv
+from pydantic import BaseModel, Field, Json
+from pymongo.read_preferences import Primary, SecondaryPreferred
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+
+class AutoApprovalRule(BaseModel):
+    """A pending transfer meeting every condition is approved without waiting for an admin"""
+
+    name: str
+    transaction_types: List[str]  # "self", "internal", "domestic", "international"
+    max_amount: float = Field(gt=0)
+    min_account_age_days: float = Field(default=0, ge=0)  # sender's account age
+    max_daily_total: Optional[float] = Field(default=None, gt=0)  # sender's approved outflow today, this one included
+    max_risk_score: Optional[int] = Field(default=None, ge=0, le=100)
+
+
+class Settings(BaseModel):
+    """Each field is read from the environment variable of the same name, upper-cased"""
+
+    # MongoDB connection pool and timeouts
+    mongo_url: str
+    db_name: str
+    mongo_max_pool_size: int = Field(default=100, ge=1)
+    mongo_min_pool_size: int = Field(default=0, ge=0)
+    mongo_warm_connections: int = Field(default=0, ge=0)  # opened before the first request is served
+    mongo_wait_queue_timeout_ms: int = Field(default=2000, ge=0)  # wait for a free pooled connection
+    mongo_connect_timeout_ms: int = Field(default=5000, ge=0)
+    mongo_socket_timeout_ms: int = Field(default=10000, ge=0)
+    mongo_server_selection_timeout_ms: int = Field(default=5000, ge=0)
+
+    # Read-heavy admin list endpoints can read from secondaries, at most this stale
+    reporting_read_preference: Literal["primary", "secondaryPreferred"] = "secondaryPreferred"
+    reporting_max_staleness_seconds: int = Field(default=90, ge=90)  # MongoDB's minimum is 90
+
+    # Auth
+    secret_key: str = 'your-secret-key-change-this-in-production'
+    bootstrap_admin: bool = True  # create the default admin user if none exists
+
+    # Password hashing; pick values with calibrate_password_hash.py
+    password_scheme: Literal["bcrypt", "argon2"] = "bcrypt"
+    bcrypt_rounds: int = Field(default=12, ge=4, le=31)
+    argon2_time_cost: int = Field(default=2, ge=1)
+    argon2_memory_cost_kib: int = Field(default=65536, ge=8)
+    argon2_parallelism: int = Field(default=1, ge=1)
+
+    # Request handling
+    idempotency_ttl_seconds: int = Field(default=86400, ge=1)
+    idempotency_lease_seconds: int = Field(default=30, ge=1)  # after this a retry takes over an unfinished attempt
+    trusted_proxy_count: int = Field(default=0, ge=0)  # proxies that append to X-Forwarded-For in front of the app
+    transaction_batch_max_size: int = Field(default=50, ge=1)
+    transaction_batch_window_ms: float = Field(default=5, ge=0)
+
+    # Audit log pipeline
+    audit_queue_size: int = Field(default=10000, ge=1)
+    audit_batch_size: int = Field(default=500, ge=1)
+    audit_flush_interval_ms: float = Field(default=500, gt=0)
+    audit_enqueue_timeout_ms: float = Field(default=100, ge=0)  # how long a full queue may stall a request
+
+    # Transfer risk scoring
+    risk_persist_interval_seconds: float = Field(default=30, gt=0)
+
+    # Scheduled and recurring transfers
+    scheduler_horizon_seconds: int = Field(default=600, ge=10)  # how far ahead schedules are loaded into memory
+    scheduler_batch_size: int = Field(default=500, ge=1)
+
+    # Request timing and profiling
+    slow_request_ms: float = Field(default=500, ge=0)  # slower requests are always logged
+    timing_log_sample_rate: float = Field(default=0.01, ge=0, le=1)  # share of other requests logged
+    profile_token: Optional[str] = None  # enables the X-Profile header for requests carrying X-Profile-Token
+    profile_dir: str = "/tmp/elittrustbank-profiles"
+
+    # Outbox relay for approval events; set the sink path in one process only
+    outbox_sink_path: Optional[str] = None  # NDJSON file the relay appends to; unset disables the relay
+    outbox_batch_size: int = Field(default=500, ge=1)
+    outbox_poll_interval_ms: float = Field(default=1000, gt=0)
+    outbox_gap_timeout_seconds: float = Field(default=30, gt=0)  # how long to wait on a seq whose write never landed
+    outbox_retention_days: int = Field(default=7, ge=1)
+
+    # Auto-approval of low-risk transfers, e.g. AUTO_APPROVAL_RULES=
+    # [{"name": "small-self", "transaction_types": ["self"], "max_amount": 500}]
+    auto_approval_rules: Json[List[AutoApprovalRule]] = []  # evaluated in order; none disables the workers
+    auto_approval_workers: int = Field(default=4, ge=1)
+    auto_approval_poll_interval_ms: float = Field(default=1000, gt=0)
+
+    # Live dashboard events; "change_stream" (needs a replica set) when several workers serve streams
+    live_events_source: Literal["local", "change_stream"] = "local"
+    live_events_queue_size: int = Field(default=100, ge=1)  # per open stream; overflow asks the client to reload
+    live_events_heartbeat_seconds: float = Field(default=15, gt=0)
+
+    # Per-user recent transactions served to the dashboard from memory. Only the change_stream
+    # live events source sees other workers' writes, so the TTL defaults to 300s with it and 5s without
+    recent_transactions_cache_users: int = Field(default=10000, ge=1)
+    recent_transactions_ttl_seconds: Optional[float] = Field(default=None, gt=0)
+
+    # Transaction archiving
+    archive_after_days: int = Field(default=90, ge=1)  # settled transactions older than this leave the hot collection
+    archive_batch_size: int = Field(default=1000, ge=1)
+
+    # Bank-wide analytics cache
+    analytics_ttl_seconds: int = Field(default=300, ge=0)
+    analytics_invalidate_amount: float = Field(default=10000, ge=0)  # writes this large drop the cache
+    analytics_daily_window_days: int = Field(default=30, ge=1)
+
+    @classmethod
+    def from_env(cls, environ: Optional[Mapping[str, str]] = None) -> "Settings":
+        environ = os.environ if environ is None else environ
+        values = {name: environ[name.upper()] for name in cls.model_fields if name.upper() in environ}
+        return cls(**values)
+
+    def mongo_client_options(self) -> dict:
+        """Keyword arguments for AsyncIOMotorClient"""
+        return {
+            "maxPoolSize": self.mongo_max_pool_size,
+            "minPoolSize": max(self.mongo_min_pool_size, self.mongo_warm_connections),
+            "waitQueueTimeoutMS": self.mongo_wait_queue_timeout_ms,
+            "connectTimeoutMS": self.mongo_connect_timeout_ms,
+            "socketTimeoutMS": self.mongo_socket_timeout_ms,
+            "serverSelectionTimeoutMS": self.mongo_server_selection_timeout_ms,
+        }
+
+    def password_context_config(self) -> dict:
+        """CryptContext settings; hashes in the other scheme or below the configured cost need updating"""
+        other = "argon2" if self.password_scheme == "bcrypt" else "bcrypt"
+        return {
+            "schemes": [self.password_scheme, other],
+            "deprecated": [other],
+            "bcrypt__default_rounds": self.bcrypt_rounds,
+            "bcrypt__min_rounds": self.bcrypt_rounds,
+            "argon2__time_cost": self.argon2_time_cost,
+            "argon2__memory_cost": self.argon2_memory_cost_kib,
+            "argon2__parallelism": self.argon2_parallelism,
+        }
+
+    def recent_transactions_cache_ttl(self) -> float:
+        if self.recent_transactions_ttl_seconds is not None:
+            return self.recent_transactions_ttl_seconds
+        return 300 if self.live_events_source == "change_stream" else 5
+
+    def reporting_read_preference_mode(self):
+        if self.reporting_read_preference == "primary":
+            return Primary()
+        return SecondaryPreferred(max_staleness=self.reporting_max_staleness_seconds)
@@ -0,0 +1,18 @@
+"""Timestamp normalization: stored timestamps are naive UTC with millisecond precision"""
+from datetime import datetime, timezone
+from typing import Optional
+
+
+def as_naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    # Stored timestamps are naive UTC
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def as_stored_datetime(value: Optional[datetime]) -> Optional[datetime]:
+    """A timestamp as Mongo returns it once stored: naive UTC, truncated to milliseconds"""
+    value = as_naive_utc(value)
+    if value is not None:
+        value = value.replace(microsecond=value.microsecond // 1000 * 1000)
+    return value
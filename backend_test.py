@@ -1,4 +1,6 @@
+import os
 import requests
+import subprocess
 import time
 import uuid
 from datetime import datetime, timedelta
@@ -763,8 +765,197 @@ class BankAPITester:
             # Validate number formatting in transactions
             self.validate_number_formatting(response, "pending-transactions")
         
+        # The newest pending transaction, once prioritized, heads the priority order
+        if success and len(response) > 1:
+            newest = response[-1]["id"]
+            success, _ = self.run_test(
+                "Set Transaction Priority",
+                "POST",
+                f"admin/pending-transactions/priority?transaction_id={newest}&priority=90",
+                200,
+                token=self.admin_token
+            )
+            if success:
+                success, by_priority = self.run_test(
+                    "Get Pending Transactions By Priority",
+                    "GET",
+                    "admin/pending-transactions?order=priority",
+                    200,
+                    token=self.admin_token
+                )
+                if success and by_priority[0]["id"] != newest:
+                    print("❌ Prioritized transaction is not first in priority order")
+                    success = False
+            self.run_test(
+                "Reset Transaction Priority",
+                "POST",
+                f"admin/pending-transactions/priority?transaction_id={newest}&priority=0",
+                200,
+                token=self.admin_token
+            )
+        
         return success
         
+    def test_transaction_query_plans(self):
+        """Test that every supported ops query filter shape is served by an index"""
+        if not self.admin_token or not self.customer_id:
+            print("❌ Admin token or customer ID not available, skipping test")
+            return False
+        
+        week_ago = (datetime.utcnow() - timedelta(days=7)).isoformat()
+        shapes = {
+            "status + type + amount + date": (
+                f"status=pending&transaction_type=international&min_amount=10000&start={week_ago}",
+                {"ops_type_status_created"}
+            ),
+            "type + date": (f"transaction_type=debit&start={week_ago}", {"ops_type_created"}),
+            "status": ("status=pending", {"ops_status_created"}),
+            "user + status": (
+                f"user_id={self.customer_id}&status=approved",
+                {"ops_from_user_created", "ops_to_user_created"}
+            ),
+            "date + amount": (f"start={week_ago}&max_amount=500", {"ops_created"}),
+        }
+        
+        def plan_stages(plan):
+            yield plan
+            for child in plan.get("inputStages", []) + [plan.get("inputStage")]:
+                if child:
+                    yield from plan_stages(child)
+        
+        all_passed = True
+        for shape, (params, expected_indexes) in shapes.items():
+            success, response = self.run_test(
+                f"Explain Transaction Query ({shape})",
+                "GET",
+                f"admin/transactions/query?{params}&explain=true",
+                200,
+                token=self.admin_token
+            )
+            if not success:
+                all_passed = False
+                continue
+            
+            stages = list(plan_stages(response["winning_plan"]))
+            stage_names = {stage["stage"] for stage in stages}
+            used_indexes = {stage["indexName"] for stage in stages if stage["stage"] == "IXSCAN"}
+            if "COLLSCAN" in stage_names or "SORT" in stage_names or used_indexes != expected_indexes:
+                print(f"❌ {shape} not index-served: stages {sorted(stage_names)}, indexes {sorted(used_indexes)}")
+                all_passed = False
+            else:
+                print(f"✅ {shape} served by {', '.join(sorted(used_indexes))}")
+        
+        # Keyset pages must not overlap
+        success, first_page = self.run_test(
+            "Transaction Query First Page",
+            "GET",
+            f"admin/transactions/query?user_id={self.customer_id}&limit=2",
+            200,
+            token=self.admin_token
+        )
+        if success and first_page.get("next_cursor"):
+            success, second_page = self.run_test(
+                "Transaction Query Second Page",
+                "GET",
+                f"admin/transactions/query?user_id={self.customer_id}&limit=2&cursor={first_page['next_cursor']}",
+                200,
+                token=self.admin_token
+            )
+            first_ids = {t["id"] for t in first_page["transactions"]}
+            second_ids = {t["id"] for t in second_page.get("transactions", [])}
+            if not success or first_ids & second_ids:
+                print("❌ Keyset pages overlap")
+                all_passed = False
+        
+        return all_passed
+        
+    def test_recent_transactions_consistency(self):
+        """Test that the dashboard's cached recent transactions match the source query after each kind of write"""
+        if not self.admin_token or not self.customer_token or not self.customer_id:
+            print("❌ Admin token or customer token not available, skipping test")
+            return False
+        
+        def recent_matches_source(label):
+            success, dashboard = self.run_test(f"Dashboard Recent Transactions ({label})", "GET", "dashboard", 200, token=self.customer_token)
+            if not success:
+                return False
+            success, transactions = self.run_test(f"Transactions Source Query ({label})", "GET", "transactions", 200, token=self.customer_token)
+            if not success:
+                return False
+            cached = [(t["id"], t["status"], t["amount"]) for t in dashboard["recent_transactions"]]
+            source = [(t["id"], t["status"], t["amount"]) for t in transactions[:10]]
+            if cached != source:
+                print(f"❌ Recent transactions differ after {label}:\n  dashboard {cached}\n  source    {source}")
+                return False
+            print(f"✅ Recent transactions match the source query after {label}")
+            return True
+        
+        all_passed = recent_matches_source("cold start")
+        
+        success, _ = self.run_test(
+            "Manual Credit For Consistency",
+            "POST",
+            "admin/manual-transaction",
+            200,
+            data={"user_id": self.customer_id, "action": "credit", "amount": 25.00,
+                  "account_type": "checking", "description": "Recent transactions consistency"},
+            token=self.admin_token
+        )
+        all_passed = success and recent_matches_source("manual credit") and all_passed
+        
+        # The admin UI sends custom dates from toISOString(), with a trailing Z
+        backdated = (datetime.utcnow() - timedelta(minutes=1)).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+        success, _ = self.run_test(
+            "Backdated Manual Credit For Consistency",
+            "POST",
+            "admin/manual-transaction",
+            200,
+            data={"user_id": self.customer_id, "action": "credit", "amount": 5.00, "account_type": "checking",
+                  "description": "Recent transactions consistency", "custom_date": backdated},
+            token=self.admin_token
+        )
+        all_passed = success and recent_matches_source("backdated manual credit") and all_passed
+        
+        success, _ = self.run_test(
+            "Self Transfer For Consistency",
+            "POST",
+            "transfer",
+            200,
+            data={"amount": 1.00, "transaction_type": "self", "from_account_type": "checking",
+                  "to_account_info": "savings", "description": "Recent transactions consistency"},
+            token=self.customer_token
+        )
+        all_passed = success and recent_matches_source("new transfer") and all_passed
+        
+        success, transactions = self.run_test("Find Consistency Transfer", "GET", "transactions", 200, token=self.customer_token)
+        pending = [t for t in transactions if t["status"] == "pending" and t["description"] == "Recent transactions consistency"]
+        if not pending:
+            print("❌ Consistency transfer not found")
+            return False
+        success, _ = self.run_test(
+            "Approve Consistency Transfer",
+            "POST",
+            f"admin/process-transaction?transaction_id={pending[0]['id']}&action=approve",
+            200,
+            token=self.admin_token
+        )
+        all_passed = success and recent_matches_source("approval") and all_passed
+        
+        # The accrual job writes transactions straight to the database, bypassing the
+        # app's write-through; a high rate makes the approved $1 in savings earn a cent
+        accrual = subprocess.run(
+            [sys.executable, "accrue_interest.py", "--period", f"consistency-{uuid.uuid4()}", "--tiers", "0:0.12"],
+            cwd=os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"),
+            capture_output=True, text=True
+        )
+        if accrual.returncode != 0:
+            print(f"❌ Interest accrual job failed:\n{accrual.stderr}")
+            return False
+        print(f"✅ {accrual.stdout.strip()}")
+        all_passed = recent_matches_source("interest accrual") and all_passed
+        
+        return all_passed
+
     def test_specific_transaction_approval(self, transaction_id, user_id, amount):
         """Test approving a specific transaction after adding funds to user"""
         if not self.admin_token:
@@ -865,6 +1056,16 @@ class BankAPITester:
             print("❌ Getting pending transactions failed, stopping tests")
             return self.report_results()
         
+        # Ops transaction query plans
+        if not self.test_transaction_query_plans():
+            print("❌ Transaction query plan tests failed, stopping tests")
+            return self.report_results()
+        
+        # Dashboard recent transactions cache
+        if not self.test_recent_transactions_consistency():
+            print("❌ Recent transactions consistency tests failed, stopping tests")
+            return self.report_results()
+        
         return self.report_results()
     
     def report_results(self):
@@ -759,23 +759,110 @@ const CustomerDashboard = ({ dashboard }) => {
   });
   const [isMobileMenuOpen, setIsMobileMenuOpen] = useState(false);
 
-  // Real-time data fetching
+  // Real-time data: a dashboard load on each stream connect, then incremental events
   useEffect(() => {
     setLiveData(dashboard);
     calculateIncomeOutcome(dashboard?.recent_transactions || []);
     
-    // Set up polling for real-time updates
-    const interval = setInterval(async () => {
+    const controller = new AbortController();
+    let reconnectTimer = null;
+    let reloading = false;
+    // Events that land while a reload is in flight may or may not be in its response,
+    // so they are dropped and the dashboard is loaded once more instead
+    let reloadStale = false;
+    
+    const reload = async () => {
+      if (reloading) {
+        reloadStale = true;
+        return;
+      }
+      reloading = true;
+      try {
+        // A few attempts; on a very busy account the last load is used as is
+        for (let attempt = 0; attempt < 3; attempt++) {
+          reloadStale = false;
+          const response = await axios.get(`${API}/dashboard`, { signal: controller.signal });
+          if (!reloadStale || attempt === 2) {
+            setLiveData(response.data);
+            calculateIncomeOutcome(response.data?.recent_transactions || []);
+            break;
+          }
+        }
+      } catch (error) {
+        if (!controller.signal.aborted) console.error('Error fetching live data:', error);
+      } finally {
+        reloading = false;
+      }
+    };
+    
+    const applyEvent = (type, data) => {
+      if (type === 'ready' || type === 'resync') {
+        reload();
+      } else if (reloading) {
+        reloadStale = true;
+      } else if (type === 'balance') {
+        setLiveData(current => {
+          const field = `${data.account}_balance`;
+          const balance = (parseFloat(current?.user?.[field]) || 0) + parseFloat(data.delta);
+          return { ...current, user: { ...current.user, [field]: balance.toFixed(2) } };
+        });
+      } else if (type === 'transaction') {
+        setLiveData(current => {
+          const others = (current?.recent_transactions || []).filter(t => t.id !== data.transaction.id);
+          const recent = [data.transaction, ...others]
+            .sort((a, b) => new Date(b.created_at) - new Date(a.created_at))
+            .slice(0, 10);
+          calculateIncomeOutcome(recent);
+          return { ...current, recent_transactions: recent };
+        });
+      }
+    };
+    
+    // fetch rather than EventSource so the bearer token goes in a header, not the URL
+    const connect = async () => {
       try {
-        const response = await axios.get(`${API}/dashboard`);
-        setLiveData(response.data);
-        calculateIncomeOutcome(response.data?.recent_transactions || []);
+        const response = await fetch(`${API}/events/stream`, {
+          headers: { Authorization: `Bearer ${localStorage.getItem('token')}` },
+          signal: controller.signal
+        });
+        if (!response.ok) throw new Error(`Event stream failed: ${response.status}`);
+        // Anything before the server's "ready" event (including since the
+        // initial load) is only in a fresh load, which applyEvent starts
+        
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        while (true) {
+          const { value, done } = await reader.read();
+          if (done) break;
+          buffer += decoder.decode(value, { stream: true });
+          let boundary;
+          while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const message = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            let type = 'message';
+            let data = '';
+            message.split('\n').forEach(line => {
+              if (line.startsWith('event: ')) type = line.slice(7);
+              else if (line.startsWith('data: ')) data += line.slice(6);
+            });
+            if (data) applyEvent(type, JSON.parse(data));
+          }
+        }
       } catch (error) {
-        console.error('Error fetching live data:', error);
+        if (controller.signal.aborted) return;
+        console.error('Live event stream error:', error);
       }
-    }, 5000); // Poll every 5 seconds for real-time updates
+      if (!controller.signal.aborted) {
+        reconnectTimer = setTimeout(connect, 3000);
+      }
+    };
+    connect();
 
-    return () => clearInterval(interval);
+    return () => {
+      controller.abort();
+      clearTimeout(reconnectTimer);
+    };
   }, [dashboard]);
 
   const calculateIncomeOutcome = (transactions) => {